@@ -0,0 +1,73 @@
+"""Bytes transferred and time to frame of the CSV extract path per codec
+(plain, gzip, zstd), reading synthetic extracts from a local directory standing
+in for the object store. Each read runs in a fresh interpreter so its peak
+memory shows whether the decompressed text was ever held whole.
+
+`--mbps` adds the time the compressed bytes would take to arrive at that
+bandwidth, the part of a cold load from S3 the local reads leave out.
+
+    python benchmarks/compressed.py --rows 2000000 --mbps 200
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import synth  # noqa: E402
+from memory import peak_rss_kb  # noqa: E402
+
+NAMES = ["pmpm_by_service_category_1_provider", "condition_data"]
+CODECS = ["csv", "csv.gz", "csv.zst"]
+
+
+def measure(uri, name):
+    import extracts
+
+    before = peak_rss_kb()
+    start = time.perf_counter()
+    data = extracts.read(name, uri)
+    elapsed = time.perf_counter() - start
+    peak = peak_rss_kb() - before
+    print(f"{len(data)},{elapsed:.3f},{peak / 1024:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--mbps", type=float, default=200.0)
+    parser.add_argument("--name", action="append", choices=NAMES)
+    parser.add_argument("--measure", nargs=2, metavar=("URI", "NAME"))
+    args = parser.parse_args()
+    if args.measure:
+        return measure(*args.measure)
+
+    print("extract,codec,rows,file_mb,seconds,peak_rss_mb,seconds_at_mbps")
+    for name in args.name or NAMES:
+        for codec in CODECS:
+            # One copy per directory, or the reader would pick the preferred
+            # codec every time
+            with tempfile.TemporaryDirectory() as tmp:
+                uri = tmp + "/"
+                synth.write(uri, args.rows, formats=(codec,), names=[name])
+                size = os.path.getsize(uri + name + "." + codec)
+                out = subprocess.run(
+                    [sys.executable, __file__, "--measure", uri, name],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                ).stdout.strip()
+            rows, seconds, peak = out.split(",")
+            transfer = size * 8 / (args.mbps * 1e6)
+            print(
+                f"{name},{codec},{rows},{size / 2**20:.1f},{seconds},{peak},"
+                f"{float(seconds) + transfer:.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Checks util.ConnectionPool against sqlite3 standing in for the Snowflake
+connector: nothing connects until first use, `max_size` blocks callers,
+connections failing the health check are replaced, idle connections expire
+after `idle_timeout`, and neither broken connections nor failed connects
+leak a slot.
+
+    python benchmarks/connection_pool.py
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import util  # noqa: E402
+
+
+class Connector:
+    """connect() for the pool, counting connections and failing on demand."""
+
+    def __init__(self):
+        self.opened = []
+        self.fail = 0
+
+    def __call__(self):
+        if self.fail:
+            self.fail -= 1
+            raise sqlite3.OperationalError("cannot connect")
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.opened.append(conn)
+        return conn
+
+
+def is_open(conn):
+    try:
+        conn.execute("select 1")
+        return True
+    except sqlite3.ProgrammingError:
+        return False
+
+
+def check_lazy_and_blocking():
+    connector = Connector()
+    pool = util.ConnectionPool(connector, max_size=2)
+    assert not connector.opened, "connected at construction"
+    first, second = pool.acquire(), pool.acquire()
+    try:
+        pool.acquire(timeout=0.1)
+        raise AssertionError("acquired past max_size")
+    except TimeoutError:
+        pass
+
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire(timeout=5)))
+    waiter.start()
+    time.sleep(0.1)
+    assert not got, "did not block at max_size"
+    pool.release(first)
+    waiter.join()
+    assert got == [first] and pool.size == 2 and len(connector.opened) == 2
+    pool.release(second)
+    pool.release(got[0])
+
+
+def check_health_check():
+    connector = Connector()
+    pool = util.ConnectionPool(connector, max_size=1)
+    conn = pool.acquire()
+    conn.close()
+    pool.release(conn)
+    replacement = pool.acquire(timeout=1)
+    assert replacement is not conn and is_open(replacement)
+    assert pool.size == 1 and len(connector.opened) == 2
+    pool.release(replacement)
+
+
+def check_idle_timeout():
+    connector = Connector()
+    pool = util.ConnectionPool(connector, max_size=1, idle_timeout=0.1)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn, "reconnected before the idle timeout"
+    pool.release(conn)
+    time.sleep(0.2)
+    fresh = pool.acquire(timeout=1)
+    assert fresh is not conn and not is_open(conn), "expired connection kept"
+    assert pool.size == 1
+    pool.release(fresh)
+
+
+def check_no_leaks():
+    connector = Connector()
+    pool = util.ConnectionPool(connector, max_size=1)
+    # A broken connection handed back takes its slot with it to the next
+    # caller, who gets a replacement
+    for _ in range(10):
+        conn = pool.acquire(timeout=1)
+        conn.close()
+        pool.release(conn)
+    assert pool.size == 1 and len(connector.opened) == 10
+    # A replacement that cannot connect gives the slot back
+    connector.fail = 1
+    try:
+        pool.acquire(timeout=1)
+        raise AssertionError("connect failure not raised")
+    except sqlite3.OperationalError:
+        pass
+    assert pool.size == 0
+    conn = pool.acquire(timeout=1)
+    assert is_open(conn) and pool.size == 1
+    pool.release(conn)
+    pool.close()
+    assert pool.size == 0
+
+
+def main():
+    for check in [
+        check_lazy_and_blocking,
+        check_health_check,
+        check_idle_timeout,
+        check_no_leaks,
+    ]:
+        check()
+        print(f"{check.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""CSV parse throughput per extract: pandas' default reader with dtype
+inference (the loaders before schemas.py) against extracts.read_csv, Arrow's
+multithreaded reader parsing into the declared schema. Both read the columns
+the pages use.
+
+    python benchmarks/csv_parse.py --rows 2000000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pandas as pd  # noqa: E402
+import pyarrow as pa  # noqa: E402
+
+import extracts  # noqa: E402
+import synth  # noqa: E402
+
+
+def timed(read, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = read()
+        best = min(best, time.perf_counter() - start)
+    return data, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--name", action="append", choices=list(extracts.EXTRACTS))
+    args = parser.parse_args()
+
+    print(f"arrow threads: {pa.cpu_count()}")
+    print("extract,rows,file_mb,pandas_mb_s,arrow_mb_s,speedup")
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = tmp + "/"
+        names = args.name or list(extracts.EXTRACTS)
+        synth.write(uri, args.rows, formats=("csv",), names=names)
+        for name in names:
+            path = uri + name + ".csv"
+            columns = extracts.EXTRACTS[name].get("columns")
+            size = os.path.getsize(path) / 2**20
+            converters = {"year": str} if "year" in (columns or []) else None
+            expected, before = timed(
+                lambda: pd.read_csv(path, usecols=columns, converters=converters),
+                args.repeat,
+            )
+            data, after = timed(
+                lambda: extracts.read_csv(name, uri, columns), args.repeat
+            )
+            pd.testing.assert_frame_equal(
+                data, expected[list(data.columns)], check_dtype=False
+            )
+            print(
+                f"{name},{len(data)},{size:.1f},{size / before:.1f},"
+                f"{size / after:.1f},{before / after:.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
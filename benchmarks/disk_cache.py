@@ -0,0 +1,152 @@
+"""Cold and warm restarts through the local disk cache (localcache.py), with a
+local directory standing in for the bucket. Each run is a fresh interpreter
+reading every extract the way a new server process does. Checks that:
+
+- a restart after the cold run reads everything from disk, fetching nothing,
+- several processes filling one cache at once with a budget smaller than the
+  extracts all read the same frames and leave the cache within budget,
+- a copy damaged on disk is detected and fetched again.
+
+`--mbps` adds the time the fetched bytes would take to arrive at that
+bandwidth, the part of a cold start from S3 the local reads leave out.
+
+    python benchmarks/disk_cache.py --rows 2000000 --mbps 200
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import synth  # noqa: E402
+
+
+def measure():
+    import extracts
+    import instrument
+
+    start = time.perf_counter()
+    checksums = {}
+    with instrument.Span("benchmark", "restart") as span:
+        for name in extracts.EXTRACTS:
+            checksums[name] = extracts.checksum(extracts.read(name))
+    print(
+        json.dumps(
+            {
+                "seconds": time.perf_counter() - start,
+                "fetched": span.bytes or 0,
+                "checksums": checksums,
+            }
+        )
+    )
+
+
+def run(uri, cache_dir=None, budget=None, processes=1):
+    env = dict(os.environ, DATA_STORIES_EXTRACT_URI=uri)
+    env.pop("DATA_STORIES_DISK_CACHE", None)
+    if cache_dir:
+        env["DATA_STORIES_DISK_CACHE"] = cache_dir
+    if budget:
+        env["DATA_STORIES_DISK_CACHE_BYTES"] = str(budget)
+    children = [
+        subprocess.Popen(
+            [sys.executable, __file__, "--measure"],
+            env=env,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        for _ in range(processes)
+    ]
+    results = []
+    for child in children:
+        out, _ = child.communicate()
+        if child.returncode:
+            raise SystemExit(f"measure run failed ({child.returncode})")
+        results.append(json.loads(out))
+    return results
+
+
+def cached_bytes(cache_dir):
+    import localcache
+
+    localcache.root = cache_dir
+    return sum(size for _, size, _ in localcache.entries())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--mbps", type=float, default=200.0)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--measure", action="store_true")
+    args = parser.parse_args()
+    if args.measure:
+        return measure()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = os.path.join(tmp, "bucket") + "/"
+        synth.write(uri, args.rows)
+        total = sum(
+            os.path.getsize(os.path.join(uri, f))
+            for f in os.listdir(uri)
+            if f.endswith(".parquet")
+        )
+
+        def report(label, result):
+            transfer = result["fetched"] * 8 / (args.mbps * 1e6)
+            print(
+                f"{label:28} {result['seconds']:7.2f}s "
+                f"{result['fetched'] / 2**20:8.1f} MB fetched "
+                f"{result['seconds'] + transfer:7.2f}s at {args.mbps:g} Mbps"
+            )
+
+        print(f"extracts: {total / 2**20:.1f} MB")
+        (direct,) = run(uri)
+        direct["fetched"] = total
+        report("no disk cache", direct)
+
+        cache_dir = os.path.join(tmp, "cache")
+        (cold,) = run(uri, cache_dir)
+        report("cold start", cold)
+        (warm,) = run(uri, cache_dir)
+        report("restart", warm)
+        assert warm["fetched"] == 0
+        assert cold["checksums"] == warm["checksums"] == direct["checksums"]
+
+        # Damage the largest copy, the restart must notice and fetch it again
+        import localcache
+
+        localcache.root = cache_dir
+        _, size, entry = max(localcache.entries(), key=lambda e: e[1])
+        path = localcache._paths(entry)[0]
+        with open(path, "r+b") as fp:
+            fp.seek(size // 2)
+            byte = fp.read(1)
+            fp.seek(size // 2)
+            fp.write(bytes([byte[0] ^ 0xFF]))
+        (repaired,) = run(uri, cache_dir)
+        report("restart, one copy damaged", repaired)
+        assert repaired["fetched"] == size
+        assert repaired["checksums"] == direct["checksums"]
+
+        shared_dir = os.path.join(tmp, "shared")
+        budget = total // 2
+        results = run(uri, shared_dir, budget, args.processes)
+        for result in results:
+            assert result["checksums"] == direct["checksums"]
+        report(
+            f"{args.processes} processes, half budget",
+            max(results, key=lambda r: r["seconds"]),
+        )
+        kept = cached_bytes(shared_dir)
+        print(f"cache after: {kept / 2**20:.1f} MB of {budget / 2**20:.1f} MB budget")
+        assert kept <= budget
+
+
+if __name__ == "__main__":
+    main()
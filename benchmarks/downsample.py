@@ -0,0 +1,83 @@
+"""Payload size and serialization time of the time-series charts with and
+without downsampling, on daily claim type PMPM over many years. The chart
+data is serialized the way each chart ships it: rows of values inside the
+ECharts option, records for the Vega-Lite charts (st.line_chart, plost).
+Browser render time scales with the points drawn, which are reported too.
+
+    python benchmarks/downsample.py --years 20
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import downsample  # noqa: E402
+
+
+def synthetic_trend(years, seed=0):
+    rng = np.random.default_rng(seed)
+    days = pd.date_range("2000-01-01", periods=365 * years, freq="D")
+    frames = []
+    for claim_type, level in [("institutional", 400), ("professional", 250)]:
+        walk = level + np.cumsum(rng.normal(0, 2, len(days)))
+        spikes = rng.random(len(days)) < 0.001
+        frames.append(
+            pd.DataFrame(
+                {
+                    "year_month": days.strftime("%Y-%m-%d"),
+                    "claim_type": claim_type,
+                    "paid_amount_pmpm": walk + spikes * rng.gamma(5, 100, len(days)),
+                }
+            )
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def payloads(df):
+    echarts = json.dumps([df.columns.to_list()] + df.values.tolist())
+    vega = df.to_json(orient="records")
+    return len(echarts), len(vega)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--width", type=int, default=downsample.WIDTH)
+    args = parser.parse_args()
+
+    data = synthetic_trend(args.years)
+    print("method,points,echarts_kb,vega_kb,downsample_ms,serialize_ms,peak_kept")
+    for method in ["none", "lttb", "minmax"]:
+        start = time.perf_counter()
+        if method == "none":
+            sampled = data
+        else:
+            sampled = downsample.frame(
+                data,
+                "year_month",
+                "paid_amount_pmpm",
+                by="claim_type",
+                width=args.width,
+                method=method,
+            )
+        sampled_ms = (time.perf_counter() - start) * 1e3
+        start = time.perf_counter()
+        echarts, vega = payloads(sampled)
+        serialize_ms = (time.perf_counter() - start) * 1e3
+        peaks = data.groupby("claim_type")["paid_amount_pmpm"].max()
+        kept = sampled.groupby("claim_type")["paid_amount_pmpm"].max().eq(peaks).all()
+        print(
+            f"{method},{len(sampled)},{echarts / 1024:.0f},{vega / 1024:.0f},"
+            f"{sampled_ms:.1f},{serialize_ms:.1f},{kept}"
+        )
+
+
+if __name__ == "__main__":
+    main()
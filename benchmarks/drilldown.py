@@ -0,0 +1,103 @@
+"""Drilldown cube against the per-panel path the service category drilldown
+used: filtering each extract and running `util.group_for_pmpm` on every
+selectbox change. Checks the cube returns the same breakdowns for every
+selection, then times building the cube, a full interaction (four breakdowns)
+both ways, and reports the cube's memory.
+
+    python benchmarks/drilldown.py --rows 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import compact  # noqa: E402
+import drilldown  # noqa: E402
+import extracts  # noqa: E402
+import synth  # noqa: E402
+import util  # noqa: E402
+
+# Drilldown dimension -> the extract it breaks down
+EXTRACTS = {
+    "service_category_2": "pmpm_by_service_category_1_2",
+    "condition_family": "pmpm_by_service_category_1_condition",
+    "provider_name": "pmpm_by_service_category_1_provider",
+    "claim_type": "pmpm_by_service_category_1_claim_type",
+}
+
+
+def synthetic_extract(dimension, rows, seed=0):
+    name = EXTRACTS[dimension]
+    frame = synth.extract(name, rows, seed=seed)[extracts.EXTRACTS[name]["columns"]]
+    return compact.compact(name, frame, record=False)
+
+
+def per_panel(frame, dimension, service_cat, year_month, top_n=None):
+    # financial_summary.py before the cube
+    frame = (
+        frame.loc[
+            ((frame["year_month"] == year_month) | (year_month == "All Time"))
+            & frame["service_category_1"].isin([service_cat])
+        ]
+        .drop("service_category_1", axis=1)
+        .reset_index(drop=True)
+    )
+    return util.group_for_pmpm(frame, dimension, top_n)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    frames = {
+        dimension: synthetic_extract(dimension, args.rows, seed)
+        for seed, dimension in enumerate(EXTRACTS)
+    }
+    start = time.perf_counter()
+    cube = drilldown.DrilldownCube.build(
+        0, {dimension: lambda f=frame: f for dimension, frame in frames.items()}
+    )
+    build = time.perf_counter() - start
+
+    some = next(iter(frames.values()))
+    selections = [
+        (service_cat, year_month)
+        for service_cat in some["service_category_1"].unique()
+        for year_month in ["All Time"] + sorted(some["year_month"].unique())
+    ]
+    panel_seconds = cube_seconds = 0.0
+    for service_cat, year_month in selections:
+        for dimension, frame in frames.items():
+            start = time.perf_counter()
+            expected = per_panel(
+                frame,
+                dimension,
+                service_cat,
+                year_month,
+                drilldown.TOP_N.get(dimension),
+            )
+            panel_seconds += time.perf_counter() - start
+            start = time.perf_counter()
+            got = cube.lookup(dimension, service_cat, year_month)
+            cube_seconds += time.perf_counter() - start
+            # All Time sums monthly subtotals, the float sums differ in the
+            # last bits
+            pd.testing.assert_frame_equal(
+                got, expected, check_dtype=False, check_categorical=False
+            )
+
+    print(f"{len(selections)} selections x {len(frames)} breakdowns match")
+    print(cube.memory_report().round(3).to_string(index=False))
+    print(f"cube build: {build:.2f}s, {cube.nbytes / 2**20:.1f} MB")
+    print(f"per interaction, per-panel: {panel_seconds / len(selections) * 1e3:.2f}ms")
+    print(f"per interaction, cube:      {cube_seconds / len(selections) * 1e3:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Cold-load time and peak parse memory of the parquet extract path against the
+CSV fallback, on a synthetic provider-shaped extract.
+
+    python benchmarks/extract_format.py --rows 10000000
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import synth  # noqa: E402
+from memory import peak_rss_kb  # noqa: E402
+
+NAME = "pmpm_by_service_category_1_provider"
+
+
+def measure(uri, fmt):
+    """Runs in a fresh interpreter so the parse peak is not hidden by the
+    generator's own allocations."""
+    import extracts
+
+    before = peak_rss_kb()
+    start = time.perf_counter()
+    if fmt == "csv":
+        os.rename(uri + NAME + ".parquet", uri + NAME + ".parquet.off")
+    try:
+        data = extracts.read(NAME, uri)
+    finally:
+        if fmt == "csv":
+            os.rename(uri + NAME + ".parquet.off", uri + NAME + ".parquet")
+    elapsed = time.perf_counter() - start
+    peak = peak_rss_kb() - before
+    print(f"{fmt},{len(data)},{elapsed:.3f},{peak / 1024:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--measure", nargs=2, metavar=("URI", "FORMAT"))
+    args = parser.parse_args()
+    if args.measure:
+        return measure(*args.measure)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = tmp + "/"
+        synth.write(uri, args.rows, formats=("csv", "parquet"), names=[NAME])
+        sizes = {
+            "csv": os.path.getsize(uri + NAME + ".csv"),
+            "parquet": os.path.getsize(uri + NAME + ".parquet"),
+        }
+        print("format,rows,seconds,peak_rss_mb,file_mb")
+        for fmt in ["csv", "parquet"]:
+            out = subprocess.run(
+                [sys.executable, __file__, "--measure", uri, fmt],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+            print(f"{out},{sizes[fmt] / 2**20:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Time to format a drilldown-sized table for display, the per-cell
+`human_format` lambdas `util.format_df` used to apply against the vectorized
+formatter, checking both produce the same strings. The check also covers
+values on rounding boundaries (1.055, 0.00025, a 3 and a 5 decimal grid) and
+values the two render with exponents (>= 1e10, < 1e-4).
+
+    python benchmarks/format_df.py --rows 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import util  # noqa: E402
+
+
+def synthetic_table(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    current = rng.gamma(2.0, 150.0, rows)
+    prior = rng.gamma(2.0, 150.0, rows)
+    current[::50] = 0
+    prior[::70] = np.nan
+    return pd.DataFrame(
+        {
+            "category": np.array([f"Provider {i}" for i in range(rows)]),
+            "current_period_pmpm": current,
+            "prior_period_pmpm": prior,
+            "pct_change_pmpm": current / prior - 1,
+        }
+    )
+
+
+def edge_table(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    grid = np.round(rng.uniform(0, 10, rows), 3)
+    fine = np.round(rng.uniform(-1, 1, rows), 5)
+    large = 10.0 ** rng.uniform(9, 14, rows)
+    tiny = 10.0 ** rng.uniform(-9, -3, rows)
+    halves = [1.055, 2.675, 0.00025, 0.125, 999.5, 1.0005, 3.97533941338e8]
+    values = np.concatenate([grid, fine, large, tiny, halves, np.negative(halves)])
+    return pd.DataFrame({"current_period_pmpm": values, "pct_change_pmpm": values})
+
+
+def per_cell_format_df(df):
+    # util.format_df before vectorizing, for comparison
+    df = df.copy(deep=True)
+    for c in df:
+        if "pct" in c:
+            df[c] = (
+                df[c]
+                .apply(lambda x: f"{round(x, 4) * 100}%" if x else "")
+                .replace("nan%", "")
+            )
+        elif "pmpm" in c:
+            df[c] = (
+                df[c]
+                .apply(lambda x: f"${util.human_format(x)}" if x else "")
+                .replace("$nan", "")
+            )
+    df.columns = [
+        c.replace("_", " ").title().replace("Pmpm", "PMPM").replace("Pct Change", "% Δ")
+        for c in df
+    ]
+    return df
+
+
+def mismatches(data):
+    expected = per_cell_format_df(data).astype(object)
+    formatted = util.format_df(data).astype(object)
+    return int((expected != formatted).sum().sum())
+
+
+def timed(fn, data):
+    start = time.perf_counter()
+    out = fn(data)
+    return out, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    data = synthetic_table(args.rows)
+    expected, per_cell = timed(per_cell_format_df, data)
+    formatted, vectorized = timed(util.format_df, data)
+    mismatched = int((expected.astype(object) != formatted.astype(object)).sum().sum())
+    edges = mismatches(edge_table(args.rows // 4))
+    print("formatter,rows,seconds")
+    print(f"per_cell,{args.rows},{per_cell:.3f}")
+    print(f"vectorized,{args.rows},{vectorized:.3f}")
+    print(f"speedup {per_cell / vectorized:.1f}x, {mismatched} mismatched cells")
+    print(f"{edges} mismatched cells on rounding boundaries and exponents")
+    assert mismatched == edges == 0
+
+
+if __name__ == "__main__":
+    main()
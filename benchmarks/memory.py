@@ -0,0 +1,37 @@
+import resource
+
+
+def _status_kb(field):
+    try:
+        with open("/proc/self/status") as fp:
+            for line in fp:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_kb():
+    # ru_maxrss survives exec on Linux, so a child would report the parent's
+    # peak; VmHWM is reset with the new address space.
+    peak = _status_kb("VmHWM")
+    if peak is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak
+
+
+def rss_kb():
+    return _status_kb("VmRSS") or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def reset_peak_kb():
+    """Resets the peak RSS watermark where the kernel allows it, so set-up
+    allocations do not mask the peak of the step being measured. Returns the
+    watermark to measure from."""
+    try:
+        with open("/proc/self/clear_refs", "w") as fp:
+            fp.write("5")
+    except OSError:
+        pass
+    return peak_rss_kb()
@@ -0,0 +1,69 @@
+"""Year slider moves on the chronic conditions page: filtering condition_data
+and regrouping it (the page before) against summing the range from a
+PrefixSumIndex. Checks both give the same top five for every range, then
+times the index build and a slider move both ways.
+
+    python benchmarks/rangesum.py --rows 10000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import compact  # noqa: E402
+import rangesum  # noqa: E402
+import synth  # noqa: E402
+
+NAME = "condition_data"
+
+
+def filter_group(frame, start, end):
+    # 03_chronic_conditions.py before the index
+    selected = list(range(start, end + 1))
+    filtered = frame.loc[frame["diagnosis_year_key"].isin(selected)]
+    return (
+        filtered.groupby("condition", observed=True)["condition_cases"]
+        .sum()
+        .nlargest(5)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--months", type=int, default=120)
+    args = parser.parse_args()
+
+    frame = compact.compact(
+        NAME, synth.extract(NAME, args.rows, args.months), record=False
+    )
+    start = time.perf_counter()
+    index = rangesum.PrefixSumIndex(
+        frame, "diagnosis_year_key", ["condition_cases"], "condition"
+    )
+    build = time.perf_counter() - start
+
+    years = sorted(frame["diagnosis_year_key"].unique().tolist())
+    ranges = [(a, b) for a in years for b in years if a <= b]
+    scan_seconds = index_seconds = 0.0
+    for a, b in ranges:
+        start = time.perf_counter()
+        expected = filter_group(frame, a, b)
+        scan_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        got = index.range(a, b).nlargest(5, "condition_cases")
+        index_seconds += time.perf_counter() - start
+        assert list(got["condition"]) == list(expected.index)
+        assert list(got["condition_cases"]) == list(expected)
+
+    print(f"{len(ranges)} year ranges match")
+    print(f"index build: {build:.3f}s, {index.nbytes / 2**10:.1f} KB")
+    print(f"per slider move, filter+group: {scan_seconds / len(ranges) * 1e3:.2f}ms")
+    print(f"per slider move, index:        {index_seconds / len(ranges) * 1e3:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Checks that refreshing summary_stats incrementally gives the same lag
+columns as loading it cold: after a quarter changes, including across a year
+boundary, and after quarters are removed, first and middle ones alike.
+
+    python benchmarks/refresh_lags.py
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np  # noqa: E402
+
+import cache  # noqa: E402
+import extracts  # noqa: E402
+import refresh  # noqa: E402
+import synth  # noqa: E402
+
+NAME = "summary_stats"
+MEASURES = ["medical_paid", "member_months"]
+
+
+def cold(frame):
+    # What the query computes, lag() over (order by year, quarter)
+    frame = frame.sort_values(["year", "quarter"]).reset_index(drop=True)
+    for measure in MEASURES:
+        current = frame[f"current_period_{measure}"]
+        prior = current.shift().astype("float64")
+        frame[f"prior_period_{measure}"] = prior
+        frame[f"pct_change_{measure}"] = ((current - prior) / prior).fillna(0)
+    return frame
+
+
+def incremental(frame, changed=(), removed=()):
+    # `frame` as it was cached, refreshed with the new contents of `changed`
+    rows = frame.loc[frame["display"].isin(changed)].copy()
+    for measure in MEASURES:
+        rows[f"current_period_{measure}"] *= 2
+        # Whatever the partition holds, the lags are recomputed
+        rows[f"prior_period_{measure}"] = np.nan
+    dirs = [extracts.partition_dir(NAME, {"display": p}) for p in changed + removed]
+    table = refresh.merge(NAME, cache.to_table(frame), dirs, rows)
+    return table.to_pandas().sort_values("display").reset_index(drop=True)
+
+
+def expected(frame, changed=(), removed=()):
+    frame = frame.loc[~frame["display"].isin(removed)].copy()
+    for measure in MEASURES:
+        frame.loc[frame["display"].isin(changed), f"current_period_{measure}"] *= 2
+    return cold(frame)
+
+
+def check(frame, changed=(), removed=()):
+    got = incremental(frame, list(changed), list(removed))
+    want = expected(frame, list(changed), list(removed))
+    assert list(got["display"]) == list(want["display"]), (changed, removed)
+    for measure in MEASURES:
+        for column in [f"prior_period_{measure}", f"pct_change_{measure}"]:
+            assert np.allclose(
+                got[column], want[column], equal_nan=True
+            ), f"{column} after changing {changed}, removing {removed}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--months", type=int, default=36)
+    args = parser.parse_args()
+
+    frame = cold(synth.extract(NAME, months=args.months))
+    quarters = list(frame["display"])
+    cases = [{"changed": [q]} for q in quarters if q.endswith(("Q1", "Q4"))] + [
+        {"removed": [quarters[0]]},
+        {"removed": [quarters[len(quarters) // 2]]},
+        {"removed": [quarters[-1]]},
+        {"changed": [quarters[3]], "removed": [quarters[4], quarters[6]]},
+    ]
+    for case in cases:
+        check(frame, **case)
+    print(f"{len(cases)} refreshes over {len(quarters)} quarters match a cold load")
+
+
+if __name__ == "__main__":
+    main()
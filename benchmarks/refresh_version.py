@@ -0,0 +1,108 @@
+"""Checks that a refresh reaches what is derived from the extracts even when
+the refreshed extract had been evicted from the shared cache: the year-range
+index over summary_stats and the drilldown cube must both show the new month.
+
+Synthetic extracts are published without their last month, loaded and
+indexed, evicted, then the last month is published and picked up by
+refresh.poll().
+
+    python benchmarks/refresh_version.py
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import cache  # noqa: E402
+import data  # noqa: E402
+import drilldown  # noqa: E402
+import extracts  # noqa: E402
+import rangesum  # noqa: E402
+import refresh  # noqa: E402
+import synth  # noqa: E402
+
+MEASURE = "current_period_medical_paid"
+
+
+def last_period(name, frame):
+    (key,) = extracts.PARTITIONS[name][-1:]
+    return frame[key] == frame[key].max()
+
+
+def totals():
+    return rangesum.index(data.summary_stats, "year", [MEASURE]).totals("0000", "9999")[
+        MEASURE
+    ]
+
+
+def evict_all():
+    # What the LRU does under memory pressure, which leaves the version alone
+    max_bytes, cache.frames.max_bytes = cache.frames.max_bytes, 0
+    try:
+        cache.frames.put(("filler",), cache.to_table(pd.DataFrame({"x": [0]})))
+    finally:
+        cache.frames.max_bytes = max_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--months", type=int, default=24)
+    args = parser.parse_args()
+
+    names = ["summary_stats"] + [
+        loader.__name__ for loader in drilldown.DIMENSIONS.values()
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = tmp + "/"
+        full = {
+            name: synth.extract(name, args.rows, args.months).astype(
+                {"year_month": str} if name != "summary_stats" else {}
+            )
+            for name in names
+        }
+        for name, frame in full.items():
+            extracts.publish(name, frame.loc[~last_period(name, frame)], uri)
+        extracts.base_uri = uri
+        refresh.poll()
+
+        month = full["pmpm_by_service_category_1_2"]["year_month"].max()
+        before = totals()
+        assert drilldown.cube().lookup("service_category_2", "Inpatient", month).empty
+
+        version = cache.frames.version
+        evict_all()
+        assert cache.frames.version == version, "eviction bumped the version"
+
+        for name, frame in full.items():
+            extracts.publish(name, frame.loc[last_period(name, frame)], uri, True)
+        assert sorted(refresh.poll()) == sorted(names)
+        assert cache.frames.version > version
+
+        after = totals()
+        expected = full["summary_stats"][MEASURE].sum()
+        assert np.isclose(after, expected), (before, after, expected)
+        cells = drilldown.cube().lookup("service_category_2", "Inpatient", month)
+        rolled = drilldown.rollup(
+            full["pmpm_by_service_category_1_2"], "service_category_2"
+        )
+        rolled = rolled.loc[
+            (rolled["service_category_1"] == "Inpatient")
+            & (rolled["year_month"] == month)
+        ]
+        assert not cells.empty
+        assert list(cells["service_category_2"]) == list(
+            rolled["service_category_2"].astype(str)
+        )
+        assert np.allclose(cells["paid_amount_sum"], rolled["paid_amount_sum"])
+    print(f"index total {before:.2f} -> {after:.2f}, cube has {month}: ok")
+
+
+if __name__ == "__main__":
+    main()
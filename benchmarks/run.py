@@ -0,0 +1,219 @@
+"""Wall time and peak memory of every extract loader and the aggregation steps
+the pages run on them, over synthetic extracts (see synth.py) at several
+scales. Each scale runs in a fresh interpreter reading from its own temporary
+extract directory. Results are compared with baselines.json and steps slower
+or hungrier than their baseline by more than --threshold are flagged, with a
+non-zero exit status.
+
+    python benchmarks/run.py --rows 10000 --rows 100000 --rows 1000000
+    python benchmarks/run.py --rows 1000000 --update   # record new baselines
+"""
+
+import argparse
+import gc
+import inspect
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import synth  # noqa: E402
+from memory import peak_rss_kb, reset_peak_kb  # noqa: E402
+
+BASELINES = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+# Steps faster than this are all noise, they are never flagged on time
+MIN_SECONDS = 0.01
+MIN_PEAK_MB = 1.0
+
+
+def aggregation_steps(frames):
+    """(name, fn) for each aggregation step, on the loaded `frames`."""
+    import drilldown
+    import util
+
+    provider = frames["pmpm_by_service_category_1_provider"]
+    chronic = frames["pmpm_by_chronic_condition"]
+    conditions = frames["condition_data"]
+    years = sorted(chronic["year_key"].unique().tolist())
+    selected = years[-2:]
+
+    def provider_panel():
+        # A drilldown selection without the cube: filter, then group
+        panel = provider.loc[provider["service_category_1"] == "Outpatient"].drop(
+            "service_category_1", axis=1
+        )
+        return util.group_for_pmpm(panel, "provider_name", 10)
+
+    def chronic_pmpm():
+        # 03_chronic_conditions.py, PMPM by condition family
+        filtered = chronic.loc[chronic["year_key"].isin(selected)]
+        return (
+            filtered.groupby("condition_family", as_index=False, observed=True)[
+                ["medical_paid_amount_sum", "member_month_count"]
+            ]
+            .sum()
+            .sort_values("medical_paid_amount_sum", ascending=False)
+        )
+
+    def top5_conditions():
+        # 03_chronic_conditions.py, top five conditions
+        filtered = conditions.loc[conditions["diagnosis_year_key"].isin(selected)]
+        top5 = (
+            filtered.groupby("condition", observed=True)["condition_cases"]
+            .sum()
+            .nlargest(5)
+        )
+        return filtered.loc[filtered["condition"].isin(top5.index)]
+
+    def cube():
+        loaders = {
+            dimension: (lambda name=name: frames[name])
+            for dimension, name in [
+                ("service_category_2", "pmpm_by_service_category_1_2"),
+                ("condition_family", "pmpm_by_service_category_1_condition"),
+                ("provider_name", "pmpm_by_service_category_1_provider"),
+                ("claim_type", "pmpm_by_service_category_1_claim_type"),
+            ]
+        }
+        return drilldown.DrilldownCube.build(0, loaders)
+
+    grouped = util.group_for_pmpm(provider, "provider_name")
+    return [
+        (
+            "group_for_pmpm:provider",
+            lambda: util.group_for_pmpm(provider, "provider_name"),
+        ),
+        (
+            "group_for_pmpm:provider_top10",
+            lambda: util.group_for_pmpm(provider, "provider_name", 10),
+        ),
+        ("format_df:provider_grouped", lambda: util.format_df(grouped)),
+        ("filter_group:provider_panel", provider_panel),
+        ("groupby:chronic_pmpm", chronic_pmpm),
+        ("nlargest:top5_conditions", top5_conditions),
+        ("build:drilldown_cube", cube),
+    ]
+
+
+def timed(name, fn, rows):
+    gc.collect()
+    base = reset_peak_kb()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    peak_mb = (peak_rss_kb() - base) / 1024
+    print(
+        json.dumps(
+            {
+                "rows": rows,
+                "step": name,
+                "seconds": round(seconds, 4),
+                "peak_mb": round(peak_mb, 1),
+            }
+        ),
+        flush=True,
+    )
+    return result
+
+
+def measure(rows):
+    """Runs in the child, with DATA_STORIES_EXTRACT_URI pointing at the
+    synthetic extracts. The loaders are called unwrapped so each one reads
+    and compacts its extract rather than hitting the shared cache."""
+    import data
+
+    frames = {}
+    for loader in data.warm_loaders + [data.pmpm_by_service_category_1_provider]:
+        frames[loader.__name__] = timed(
+            "load:" + loader.__name__, inspect.unwrap(loader), rows
+        )
+    for name, fn in aggregation_steps(frames):
+        timed(name, fn, rows)
+
+
+def run(rows, months, seed):
+    with tempfile.TemporaryDirectory() as uri:
+        uri += "/"
+        synth.write(uri, rows, months, seed)
+        env = dict(os.environ, DATA_STORIES_EXTRACT_URI=uri, DATA_STORIES_LIVE="")
+        out = subprocess.run(
+            [sys.executable, __file__, "--measure", str(rows)],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    return [json.loads(line) for line in out.stdout.splitlines() if line]
+
+
+def compare(results, baselines, threshold):
+    """Prints every step against its baseline and returns the regressions."""
+    regressions = []
+    print(
+        f"{'rows':>10} {'step':<44} {'seconds':>9} {'base':>9} {'peak_mb':>8} {'base':>8}"
+    )
+    for result in results:
+        base = baselines.get(str(result["rows"]), {}).get(result["step"], {})
+        flags = []
+        if "seconds" in base and result["seconds"] > max(
+            base["seconds"] * (1 + threshold), base["seconds"] + MIN_SECONDS
+        ):
+            flags.append("time")
+        if "peak_mb" in base and result["peak_mb"] > max(
+            base["peak_mb"] * (1 + threshold), base["peak_mb"] + MIN_PEAK_MB
+        ):
+            flags.append("memory")
+        if flags:
+            regressions.append((result, flags))
+        print(
+            f"{result['rows']:>10} {result['step']:<44} {result['seconds']:>9.4f} "
+            f"{base.get('seconds', float('nan')):>9.4f} {result['peak_mb']:>8.1f} "
+            f"{base.get('peak_mb', float('nan')):>8.1f}"
+            + (f"  REGRESSION ({', '.join(flags)})" if flags else "")
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, action="append")
+    parser.add_argument("--months", type=int, default=36)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--update", action="store_true")
+    parser.add_argument("--measure", type=int)
+    args = parser.parse_args()
+    if args.measure:
+        return measure(args.measure)
+
+    results = [
+        result
+        for rows in args.rows or [10_000, 100_000, 1_000_000]
+        for result in run(rows, args.months, args.seed)
+    ]
+    try:
+        with open(BASELINES) as fp:
+            baselines = json.load(fp)
+    except FileNotFoundError:
+        baselines = {}
+    regressions = compare(results, baselines, args.threshold)
+    if args.update:
+        for result in results:
+            baselines.setdefault(str(result["rows"]), {})[result["step"]] = {
+                "seconds": result["seconds"],
+                "peak_mb": result["peak_mb"],
+            }
+        with open(BASELINES, "w") as fp:
+            json.dump(baselines, fp, indent=2, sort_keys=True)
+            fp.write("\n")
+    elif regressions:
+        sys.exit(f"{len(regressions)} step(s) regressed against {BASELINES}")
+
+
+if __name__ == "__main__":
+    main()
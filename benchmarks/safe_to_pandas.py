@@ -0,0 +1,126 @@
+"""Peak memory of util.safe_to_pandas against the streaming Arrow path, on a
+stand-in Snowflake cursor serving a provider-rollup-shaped result with
+NUMBER(38,2) amounts and uppercase column names.
+
+    python benchmarks/safe_to_pandas.py --rows 2000000
+"""
+
+import argparse
+import decimal
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from memory import peak_rss_kb, reset_peak_kb  # noqa: E402
+
+
+class FakeCursor:
+    """Serves a prepared Arrow table through the Snowflake cursor methods the
+    util helpers call."""
+
+    def __init__(self, table, batch_rows=100_000):
+        self.table = table
+        self.batch_rows = batch_rows
+
+    def execute(self, query):
+        return self
+
+    def fetch_pandas_all(self):
+        return self.table.to_pandas()
+
+    def fetch_arrow_batches(self):
+        for offset in range(0, self.table.num_rows, self.batch_rows):
+            yield self.table.slice(offset, self.batch_rows)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, table):
+        self.table = table
+
+    def cursor(self):
+        return FakeCursor(self.table)
+
+
+def result_table(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    months = np.array([f"2020-{m:02d}" for m in range(1, 13)])
+    paid = pa.array(np.round(rng.gamma(2.0, 500.0, rows), 2))
+    return pa.table(
+        {
+            "YEAR_MONTH": months[rng.integers(0, len(months), rows)],
+            "PROVIDER_NAME": np.char.add(
+                "Provider ", rng.integers(0, 100_000, rows).astype(str)
+            ),
+            "PAID_AMOUNT_SUM": pc.cast(paid, pa.decimal128(38, 2)),
+            "MEMBER_MONTH_COUNT": pc.cast(
+                pa.array(rng.integers(900_000, 1_100_000, rows)), pa.decimal128(38, 0)
+            ),
+            "ROW_COUNT": rng.integers(1, 200, rows),
+        }
+    )
+
+
+def sum_by_provider(accumulated, batch):
+    grouped = batch.group_by("provider_name").aggregate([("paid_amount_sum", "sum")])
+    if accumulated is None:
+        return grouped.rename_columns(["provider_name", "paid_amount_sum"])
+    both = pa.concat_tables(
+        [accumulated, grouped.rename_columns(["provider_name", "paid_amount_sum"])]
+    )
+    return (
+        both.group_by("provider_name")
+        .aggregate([("paid_amount_sum", "sum")])
+        .rename_columns(["provider_name", "paid_amount_sum"])
+    )
+
+
+def measure(mode, rows):
+    import util
+
+    conn = FakeConnection(result_table(rows))
+    before = reset_peak_kb()
+    start = time.perf_counter()
+    if mode == "safe_to_pandas":
+        result = util.safe_to_pandas(conn, "")
+    elif mode == "safe_to_arrow":
+        result = util.safe_to_arrow(conn, "").to_pandas(
+            split_blocks=True, self_destruct=True
+        )
+    else:
+        result = util.safe_to_arrow(conn, "", reducer=sum_by_provider)
+    elapsed = time.perf_counter() - start
+    peak = peak_rss_kb() - before
+    print(f"{mode},{rows},{len(result)},{elapsed:.2f},{peak / 1024:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--measure")
+    args = parser.parse_args()
+    if args.measure:
+        return measure(args.measure, args.rows)
+
+    print("mode,rows,result_rows,seconds,peak_rss_mb")
+    for mode in ["safe_to_pandas", "safe_to_arrow", "reducer"]:
+        out = subprocess.run(
+            [sys.executable, __file__, "--measure", mode, "--rows", str(args.rows)],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
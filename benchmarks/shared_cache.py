@@ -0,0 +1,66 @@
+"""Resident memory of N concurrent sessions holding the condition drilldown
+extract, served the way `st.cache_data` does it (one unpickled copy per caller)
+against the shared Arrow cache (one table, a zero-copy view per caller).
+
+    python benchmarks/shared_cache.py --sessions 50 --rows 1000000
+"""
+
+import argparse
+import os
+import pickle
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import synth  # noqa: E402
+from memory import rss_kb  # noqa: E402
+
+
+def measure(mode, sessions, rows):
+    import cache
+
+    data = synth.extract("pmpm_by_service_category_1_condition", rows)
+    if mode == "cache_data":
+        stored = pickle.dumps(data)
+        load = lambda: pickle.loads(stored)  # noqa: E731
+    else:
+        load = lambda: cache.frames.get(("condition",), lambda: data)  # noqa: E731
+    load()
+    before = rss_kb()
+    held = [load() for _ in range(sessions)]
+    after = rss_kb()
+    print(f"{mode},{sessions},{len(held[0])},{(after - before) / 1024:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--measure")
+    args = parser.parse_args()
+    if args.measure:
+        return measure(args.measure, args.sessions, args.rows)
+
+    print("mode,sessions,rows,session_rss_mb")
+    for mode in ["cache_data", "shared"]:
+        out = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--measure",
+                mode,
+                "--sessions",
+                str(args.sessions),
+                "--rows",
+                str(args.rows),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
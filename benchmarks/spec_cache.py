@@ -0,0 +1,68 @@
+"""Time to produce the claim type line chart's ECharts option on a rerun:
+building and serializing it from the frame every time, against the spec
+cache (a lookup on the dataset version and the chart's arguments) plus the
+decode the renderer does before handing the option to st_echarts.
+
+    python benchmarks/spec_cache.py --rows 100000
+"""
+
+import argparse
+import os
+import sys
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import cache  # noqa: E402
+import components  # noqa: E402
+
+
+def synthetic_trend(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    months = pd.period_range("1990-01", periods=rows // 3, freq="M").astype(str)
+    return pd.DataFrame(
+        {
+            "year_month": np.tile(months, 3),
+            "year": np.tile(months.str[:4], 3),
+            "claim_type": np.repeat(
+                ["institutional", "professional", "dme"], len(months)
+            ),
+            "paid_amount_pmpm": rng.gamma(2.0, 150.0, len(months) * 3).round(),
+        }
+    )
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    data = synthetic_trend(args.rows)
+
+    @cache.spec
+    def trend_spec(rows, animated):
+        return components.claim_type_line_chart_option(data, animated)
+
+    build = lambda: json.dumps(components.claim_type_line_chart_option(data, False))
+    print("path,ms_per_rerun")
+    print(f"build,{timed(build, args.repeat):.2f}")
+    text = trend_spec(args.rows, False)
+    print(f"cached,{timed(lambda: trend_spec(args.rows, False), args.repeat):.3f}")
+    print(f"decode,{timed(lambda: json.loads(text), args.repeat):.2f}")
+    print(cache.specs.stats())
+
+
+if __name__ == "__main__":
+    main()
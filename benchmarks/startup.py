@@ -0,0 +1,97 @@
+"""Import-time budget of each page. Imports every module a page imports at the
+top, the way a fresh worker does before running it, in a new interpreter, and
+fails when that takes longer than the page's budget or pulls in a dependency
+only some code paths need.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --repeat 5 --scale 1.5   # slower machine
+"""
+
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Seconds, best of --repeat runs
+BUDGETS = {
+    "financial_summary.py": 2.5,
+    "pages/02_general_summary.py": 2.0,
+    "pages/03_chronic_conditions.py": 2.0,
+}
+
+# Loaded on first use only: the dask provider scan, live Snowflake and DuckDB
+# queries, the secrets file, and the chart and card components
+DEFERRED = [
+    "dask",
+    "snowflake",
+    "tomli",
+    "duckdb",
+    "streamlit_echarts",
+    "streamlit_extras",
+]
+
+MEASURE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+seconds = time.perf_counter() - start
+loaded = [m for m in {deferred!r} if m in sys.modules]
+print(json.dumps({{"seconds": seconds, "loaded": loaded}}))
+"""
+
+
+def page_imports(page):
+    """The modules a page imports at module level, in order."""
+    with open(os.path.join(ROOT, page)) as fp:
+        tree = ast.parse(fp.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return modules
+
+
+def measure(page):
+    code = MEASURE.format(root=ROOT, modules=page_imports(page), deferred=DEFERRED)
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--scale", type=float, default=1.0)
+    args = parser.parse_args()
+
+    failures = []
+    print("page,seconds,budget,deferred_loaded")
+    for page, budget in BUDGETS.items():
+        runs = [measure(page) for _ in range(args.repeat)]
+        seconds = min(run["seconds"] for run in runs)
+        loaded = runs[0]["loaded"]
+        budget *= args.scale
+        print(f"{page},{seconds:.3f},{budget:.1f},{' '.join(loaded)}")
+        if seconds > budget:
+            failures.append(f"{page} took {seconds:.2f}s to import, over {budget:.1f}s")
+        if loaded:
+            failures.append(f"{page} imported {', '.join(loaded)} at start up")
+    if failures:
+        sys.exit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+"""Deterministic synthetic extracts with the schemas of every extract data.py
+loads, for the benchmarks. The four drilldown extracts, condition_data and the
+chronic condition PMPMs scale with `rows`; the rest have their natural size,
+one row per month, quarter or group. Provider counts grow with `rows` the way
+they do moving from the 5% LDS sample to a full Medicare population.
+
+    python benchmarks/synth.py /tmp/extracts/ --rows 1000000
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+
+import fsspec
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from schemas import SCHEMAS  # noqa: E402
+
+# Extracts whose size follows `rows`
+SCALED = [
+    "pmpm_by_service_category_1_2",
+    "pmpm_by_service_category_1_provider",
+    "pmpm_by_service_category_1_condition",
+    "pmpm_by_service_category_1_claim_type",
+    "pmpm_by_chronic_condition",
+    "condition_data",
+]
+
+SERVICE_CATEGORIES = {
+    "Inpatient": [
+        "Acute Inpatient",
+        "Inpatient Psychiatric",
+        "Inpatient Rehabilitation",
+        "Skilled Nursing",
+        "Hospice",
+    ],
+    "Outpatient": [
+        "Emergency Department",
+        "Outpatient Hospital or Clinic",
+        "Ambulatory Surgery",
+        "Observation",
+        "Dialysis",
+        "Outpatient Rehabilitation",
+        "Radiology",
+    ],
+    "Office Visit": ["Office Visit", "Telehealth"],
+    "Ancillary": ["Lab", "Durable Medical Equipment", "Ambulance", "Home Health"],
+    "Other": ["Other"],
+}
+
+CLAIM_TYPES = ["institutional", "professional"]
+
+CONDITION_FAMILIES = [
+    "Cardiovascular disease",
+    "Metabolic Disease",
+    "Kidney Disease",
+    "Cancer",
+    "Lung Disease",
+    "Mental Health",
+    "Neurological Disease",
+    "Musculoskeletal",
+    "Liver Disease",
+    "Autoimmune Disease",
+    "Substance Use",
+    "Blood Disorders",
+]
+
+# Chronic conditions per family
+CONDITIONS_PER_FAMILY = 6
+
+# Rows are drawn in chunks of this size, so 100M row extracts are written
+# without ever being held whole
+CHUNK_ROWS = 2_000_000
+
+
+def month_range(months, start="2018-01"):
+    return pd.period_range(start, periods=months, freq="M").strftime("%Y-%m").tolist()
+
+
+def providers(rows):
+    """Distinct rendering providers behind a provider extract of `rows`."""
+    return int(np.clip(rows // 100, 100, 1_500_000))
+
+
+def _rng(seed, name, chunk=0):
+    # One independent, reproducible stream per extract and chunk
+    return np.random.default_rng([seed, sum(map(ord, name)), chunk])
+
+
+def _member_months(months, seed):
+    rng = _rng(seed, "member_months")
+    return dict(zip(months, rng.integers(2_300_000, 2_500_000, len(months))))
+
+
+def _labels(values, codes):
+    return pd.Categorical.from_codes(codes, categories=values)
+
+
+def _drilldown_chunk(name, rows, months, rng, member_months, total_rows):
+    categories = list(SERVICE_CATEGORIES)
+    category = rng.integers(0, len(categories), rows)
+    month = rng.integers(0, len(months), rows)
+    if name == "pmpm_by_service_category_1_2":
+        dimension = "service_category_2"
+        values = [v for c in categories for v in SERVICE_CATEGORIES[c]]
+        offsets = np.cumsum([0] + [len(SERVICE_CATEGORIES[c]) for c in categories])
+        sizes = np.diff(offsets)
+        codes = offsets[category] + rng.integers(0, 1 << 30, rows) % sizes[category]
+    elif name == "pmpm_by_service_category_1_provider":
+        dimension = "provider_name"
+        values = [f"Provider {i:07d}" for i in range(providers(total_rows))]
+        # A few providers bill most of the spend
+        codes = np.minimum(rng.zipf(1.3, rows) - 1, len(values) - 1)
+    elif name == "pmpm_by_service_category_1_condition":
+        dimension = "condition_family"
+        values = CONDITION_FAMILIES
+        codes = rng.integers(0, len(values), rows)
+    else:
+        dimension = "claim_type"
+        values = CLAIM_TYPES
+        codes = rng.integers(0, len(values), rows)
+    member_month_count = np.array([member_months[m] for m in months], dtype="int64")[
+        month
+    ]
+    paid = np.round(rng.gamma(1.2, 4000.0, rows), 2)
+    return pd.DataFrame(
+        {
+            "year_month": _labels(months, month),
+            "service_category_1": _labels(categories, category),
+            dimension: _labels(values, codes),
+            "paid_amount_sum": paid,
+            "row_count": rng.integers(1, 400, rows),
+            "member_month_count": member_month_count,
+            "paid_amount_pmpm": paid / member_month_count,
+        }
+    )
+
+
+def _chunk(name, rows, months, rng, member_months, total_rows):
+    if name.startswith("pmpm_by_service_category_1_"):
+        return _drilldown_chunk(name, rows, months, rng, member_months, total_rows)
+    if name == "pmpm_by_chronic_condition":
+        month = rng.integers(0, len(months), rows)
+        return pd.DataFrame(
+            {
+                "year_month": _labels(months, month),
+                "condition_family": _labels(
+                    CONDITION_FAMILIES, rng.integers(0, len(CONDITION_FAMILIES), rows)
+                ),
+                "medical_paid_amount_sum": np.round(rng.gamma(2.0, 50_000.0, rows), 2),
+                "member_month_count": np.array(
+                    [member_months[m] for m in months], dtype="int64"
+                )[month],
+            }
+        )
+    # condition_data
+    conditions = [
+        f"{family} {i + 1}"
+        for family in CONDITION_FAMILIES
+        for i in range(CONDITIONS_PER_FAMILY)
+    ]
+    return pd.DataFrame(
+        {
+            "diagnosis_year_month": _labels(months, rng.integers(0, len(months), rows)),
+            "condition": _labels(conditions, rng.integers(0, len(conditions), rows)),
+            "condition_cases": rng.integers(1, 2_000, rows),
+            "diagnosis_duration": np.round(rng.gamma(2.0, 120.0, rows), 1),
+        }
+    )
+
+
+def _summary_stats(months, rng, member_months):
+    quarters = sorted({(m[:4], str((int(m[5:]) - 1) // 3 + 1)) for m in months})
+    frame = pd.DataFrame(quarters, columns=["year", "quarter"])
+    frame.insert(0, "display", frame["year"] + "Q" + frame["quarter"])
+    frame["current_period_medical_paid"] = np.round(
+        rng.uniform(2.0e9, 2.4e9, len(frame)), 2
+    )
+    frame["current_period_member_months"] = [
+        sum(
+            v
+            for m, v in member_months.items()
+            if (m[:4], q) == (y, str((int(m[5:]) - 1) // 3 + 1))
+        )
+        for y, q in quarters
+    ]
+    frame["prior_quarter"] = frame["quarter"].shift()
+    for measure in ["medical_paid", "member_months"]:
+        current = frame[f"current_period_{measure}"]
+        prior = current.shift().astype("float64")
+        frame[f"prior_period_{measure}"] = prior
+        frame[f"pct_change_{measure}"] = ((current - prior) / prior).fillna(0)
+    return frame
+
+
+def _fixed(name, months, rng, member_months):
+    n = len(months)
+    if name == "year_months":
+        return pd.DataFrame(
+            {"year_month": months, "sum(paid_amount)": rng.uniform(4e8, 6e8, n)}
+        )
+    if name == "summary_stats":
+        return _summary_stats(months, rng, member_months)
+    if name == "pmpm_by_claim_type":
+        frame = pd.DataFrame(
+            [(m, c) for m in months for c in CLAIM_TYPES + ["pharmacy"]],
+            columns=["year_month", "claim_type"],
+        )
+        frame["paid_amount_sum"] = np.round(rng.gamma(4.0, 5e7, len(frame)), 2)
+        frame["member_month_count"] = frame["year_month"].map(member_months)
+        frame["year"] = frame["year_month"].str[:4]
+        frame["paid_amount_pmpm"] = (
+            frame["paid_amount_sum"] / frame["member_month_count"]
+        )
+        return frame
+    if name == "pmpm_by_service_category_1":
+        frame = pd.DataFrame(
+            [(m, c) for m in months for c in SERVICE_CATEGORIES],
+            columns=["year_month", "service_category_1"],
+        )
+        frame["paid_amount_sum"] = np.round(rng.gamma(4.0, 4e7, len(frame)), 2)
+        frame["row_count"] = rng.integers(10_000, 500_000, len(frame))
+        frame["member_month_count"] = frame["year_month"].map(member_months)
+        frame["paid_amount_pmpm"] = (
+            frame["paid_amount_sum"] / frame["member_month_count"]
+        )
+        return frame
+    if name == "pmpm_data":
+        frame = pd.DataFrame({"year_month": months})
+        parts = ["inpatient", "outpatient", "office_visit", "ancillary", "other"]
+        for part in parts:
+            frame[f"{part}_pmpm"] = rng.uniform(50, 400, n)
+        frame["medical_pmpm"] = frame[[f"{p}_pmpm" for p in parts]].sum(axis=1)
+        frame["pharmacy_pmpm"] = rng.uniform(50, 120, n)
+        frame["total_pmpm"] = frame["medical_pmpm"] + frame["pharmacy_pmpm"]
+        frame["member_count"] = frame["year_month"].map(member_months)
+        frame["pharmacy_spend"] = frame["pharmacy_pmpm"] * frame["member_count"]
+        return frame[SCHEMAS[name].names]
+    if name == "gender_data":
+        return pd.DataFrame(
+            {"gender": ["female", "male"], "count": [1_350_000, 1_150_000]}
+        )
+    if name == "race_data":
+        races = ["white", "black", "hispanic", "asian", "native american", "other"]
+        return pd.DataFrame({"race": races, "count": rng.integers(10_000, 2e6, 6)})
+    if name == "age_data":
+        groups = ["34-48", "49-64", "65-78", "79-98", "99+"]
+        return pd.DataFrame({"age_group": groups, "count": rng.integers(1e3, 1e6, 5)})
+    if name == "test_results":
+        count = 250
+        return pd.DataFrame(
+            {
+                "source_table": rng.choice(
+                    ["medical_claim", "pharmacy_claim", "eligibility"], count
+                ),
+                "test_category": rng.choice(
+                    ["invalid_values", "missing_values", "duplicate_values"], count
+                ),
+                "test_field": [f"field_{i % 40}" for i in range(count)],
+                "test_name": [f"test {i}" for i in range(count)],
+                "claim_type": rng.choice(CLAIM_TYPES, count),
+                "grain": rng.choice(["claim", "claim line", "member"], count),
+                "pipeline_test": rng.choice(["yes", "no"], count),
+                "counts": rng.integers(0, 100_000, count),
+            }
+        )
+    if name == "use_case":
+        count = 40
+        return pd.DataFrame(
+            {
+                "use_case": [f"use case {i % 8}" for i in range(count)],
+                "test_name": [f"test {i}" for i in range(count)],
+                "test_category": rng.choice(
+                    ["invalid_values", "missing_values", "duplicate_values"], count
+                ),
+                "claim_type": rng.choice(CLAIM_TYPES, count),
+                "counts": rng.integers(0, 100_000, count),
+            }
+        )
+    # cost_summary
+    frame = pd.DataFrame(
+        [
+            (claim_type, variable, statistic)
+            for claim_type in CLAIM_TYPES
+            for variable in ["paid_amount", "allowed_amount", "charge_amount"]
+            for statistic in ["min", "p25", "median", "p75", "max", "mean"]
+        ],
+        columns=["claim_type", "variable", "statistic"],
+    )
+    frame["value"] = np.round(rng.gamma(2.0, 300.0, len(frame)), 2)
+    return frame
+
+
+def chunks(name, rows=100_000, months=36, seed=0, chunk_rows=CHUNK_ROWS):
+    """Yields the extract `name` in frames of at most `chunk_rows` rows. Only
+    the SCALED extracts are chunked, the others come whole."""
+    month_list = month_range(months)
+    member_months = _member_months(month_list, seed)
+    if name not in SCALED:
+        yield _fixed(name, month_list, _rng(seed, name), member_months)
+        return
+    for chunk, start in enumerate(range(0, rows, chunk_rows)):
+        size = min(chunk_rows, rows - start)
+        rng = _rng(seed, name, chunk)
+        yield _chunk(name, size, month_list, rng, member_months, rows)
+
+
+def extract(name, rows=100_000, months=36, seed=0):
+    """The synthetic extract `name` as one frame. Text columns come back as
+    categoricals; the same arguments always give the same frame."""
+    frames = list(chunks(name, rows, months, seed))
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True)
+
+
+def arrow_schema(name):
+    return SCHEMAS[name]
+
+
+# Codec of each CSV format write() takes
+CSV_FORMATS = {"csv": None, "csv.gz": "gzip", "csv.zst": "zstd"}
+
+
+def write(uri, rows=100_000, months=36, seed=0, formats=("parquet",), names=None):
+    """Writes every extract (or `names`) under the local directory `uri` as
+    `<name>.parquet` and/or `<name>.csv` (`.csv.gz`, `.csv.zst`), streaming
+    chunk by chunk."""
+    os.makedirs(uri, exist_ok=True)
+    for name in names or SCHEMAS:
+        schema = arrow_schema(name)
+        with contextlib.ExitStack() as stack:
+            writer = None
+            csvs = [
+                stack.enter_context(
+                    fsspec.open(
+                        os.path.join(uri, name + "." + fmt),
+                        "wt",
+                        compression=CSV_FORMATS[fmt],
+                    )
+                )
+                for fmt in formats
+                if fmt in CSV_FORMATS
+            ]
+            for i, frame in enumerate(chunks(name, rows, months, seed)):
+                table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+                if "parquet" in formats:
+                    if writer is None:
+                        writer = stack.enter_context(
+                            pq.ParquetWriter(
+                                os.path.join(uri, name + ".parquet"), schema
+                            )
+                        )
+                    writer.write_table(table)
+                for fp in csvs:
+                    frame.to_csv(fp, index=False, header=i == 0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("uri")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--months", type=int, default=36)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", action="append", choices=["parquet", *CSV_FORMATS])
+    args = parser.parse_args()
+    write(args.uri, args.rows, args.months, args.seed, args.format or ["parquet"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import argparse
+import hashlib
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import engine
+import extracts
+
+_CTE = re.compile(r"([a-z_]\w*)\s+as\s*\(", re.IGNORECASE)
+
+
+def _closing(sql, start):
+    """Index of the parenthesis closing the one at `start`."""
+    depth, quoted = 0, False
+    for i in range(start, len(sql)):
+        char = sql[i]
+        if char == "'":
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    raise ValueError("unbalanced parentheses in query")
+
+
+def split_ctes(sql):
+    """`with a as (...), b as (...) select ...` -> ([(a, body), (b, body)],
+    "select ..."). A query without a WITH clause has no CTEs."""
+    match = re.match(r"\s*with\s+", sql, re.IGNORECASE)
+    if match is None:
+        return [], sql
+    ctes, pos = [], match.end()
+    while True:
+        match = _CTE.match(sql, pos)
+        if match is None:
+            raise ValueError(f"cannot parse CTE at: {sql[pos:pos + 40]!r}")
+        end = _closing(sql, match.end() - 1)
+        ctes.append((match.group(1).lower(), sql[match.end() : end]))
+        pos = end + 1
+        while pos < len(sql) and sql[pos].isspace():
+            pos += 1
+        if not sql.startswith(",", pos):
+            return ctes, sql[pos:]
+        pos += 1
+        while sql[pos].isspace():
+            pos += 1
+
+
+def normalize(sql):
+    """Case, whitespace and comments do not change what a query computes; two
+    CTEs with the same normalized body are the same intermediate."""
+    parts = sql.split("'")
+    for i in range(0, len(parts), 2):
+        text = re.sub(r"--[^\n]*", " ", parts[i]).lower()
+        text = re.sub(r"\s+", " ", text)
+        parts[i] = re.sub(r"\s*([(),=<>+*/-])\s*", r"\1", text)
+    return "'".join(parts).strip().rstrip(";")
+
+
+def _rename(body, names):
+    # References to earlier CTEs, as a table (`from x`, `join x`) or a column
+    # qualifier (`x.col`)
+    for name, table in names.items():
+        body = re.sub(
+            rf"(\b(?:from|join)\s+){name}\b", rf"\g<1>{table}", body, flags=re.I
+        )
+        body = re.sub(rf"\b{name}\.", f"{table}.", body, flags=re.I)
+    return body
+
+
+class Plan:
+    """The extract queries as a dependency graph. `shared` holds the CTEs
+    that appear in more than one query, by the table they are materialized
+    into (`_cte_<hash of the normalized body>`), `queries` each extract's
+    query reading them instead, and `deps` what every node waits for."""
+
+    def __init__(self, queries, share=True):
+        parsed, uses = {}, Counter()
+        for name, query in queries.items():
+            ctes, select = split_ctes(query)
+            tables, items = {}, []
+            for cte, body in ctes:
+                canonical = _rename(body, tables)
+                table = (
+                    "_cte_"
+                    + hashlib.sha256(normalize(canonical).encode()).hexdigest()[:12]
+                )
+                tables[cte] = table
+                items.append((cte, body, canonical, table))
+            parsed[name] = (items, select)
+            uses.update({item[3] for item in items})
+
+        self.shared, self.names, self.queries, self.deps = {}, {}, {}, {}
+        for name, (items, select) in parsed.items():
+            if not items:
+                self.queries[name] = queries[name]
+                self.deps[name] = set()
+                continue
+            definitions, deps = [], set()
+            for cte, body, canonical, table in items:
+                if share and uses[table] > 1:
+                    self.shared[table] = canonical
+                    self.names.setdefault(table, set()).add(cte)
+                    deps.add(table)
+                    body = f"select * from {table}"
+                definitions.append(f"{cte} as ({body})")
+            self.queries[name] = "with " + ",\n".join(definitions) + "\n" + select
+            self.deps[name] = deps
+        for table, body in self.shared.items():
+            self.deps[table] = {t for t in self.shared if t != table and t in body}
+
+    def __len__(self):
+        return len(self.deps)
+
+
+def build(eng, uri, workers=4, share=True, queries=None):
+    """Recomputes every extract with the DuckDB engine `eng` and publishes them
+    under `uri`: shared CTEs are materialized once, then extracts and
+    intermediates run on `workers` threads as soon as what they read is built.
+    Returns the seconds each node took and the wall time of the build."""
+    plan = Plan(queries or engine.extract_queries(), share)
+    seconds = {}
+    publishing = threading.Lock()
+
+    def run(node):
+        start = time.perf_counter()
+        if node in plan.shared:
+            eng.materialize(node, plan.shared[node])
+        else:
+            data = eng.arrow(plan.queries[node]).to_pandas()
+            # Each publish rewrites the manifest
+            with publishing:
+                extracts.publish(node, data, uri)
+        seconds[node] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    done, running = set(), {}
+    with ThreadPoolExecutor(workers, thread_name_prefix="build") as pool:
+        while len(done) < len(plan):
+            for node, deps in plan.deps.items():
+                if node not in done and node not in running.values():
+                    if deps <= done:
+                        running[pool.submit(run, node)] = node
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                future.result()
+                done.add(running.pop(future))
+    wall = time.perf_counter() - start
+    for table in plan.shared:
+        eng.drop(table)
+
+    manifest = extracts.read_manifest(uri)
+    manifest["build"] = {
+        "seconds": round(wall, 3),
+        "workers": workers,
+        "shared": {t: sorted(names) for t, names in plan.names.items()},
+        "steps": {node: round(s, 3) for node, s in seconds.items()},
+    }
+    extracts.write_manifest(manifest, uri)
+    return seconds, wall
+
+
+def main():
+    # python build.py <raw dir> <extract uri> [--workers N] [--no-share]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("raw_dir")
+    parser.add_argument("uri")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--no-share", action="store_true")
+    args = parser.parse_args()
+
+    eng = engine.DuckDBEngine(args.raw_dir)
+    seconds, wall = build(eng, args.uri, args.workers, not args.no_share)
+    for node, s in sorted(seconds.items(), key=lambda x: -x[1]):
+        print(f"{node:45} {s:6.2f}s")
+    print(f"{'total (wall)':45} {wall:6.2f}s")
+    print(f"{'total (sum of steps)':45} {sum(seconds.values()):6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+import inspect
+import json
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+import pandas as pd
+import pyarrow as pa
+
+import instrument
+
+# String columns come back as pyarrow backed strings so the character data is
+# shared with the cached table rather than boxed into Python objects.
+_string_types = {
+    pa.string(): pd.StringDtype("pyarrow"),
+    pa.large_string(): pd.StringDtype("pyarrow"),
+}
+
+
+def to_table(data):
+    """Converts a DataFrame to the Arrow layout the cache stores. Strings are
+    kept as large_string, which is what pandas' pyarrow strings wrap, so
+    handing out views does not rewrite their offsets."""
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    fields = [
+        field.with_type(pa.large_string()) if field.type == pa.string() else field
+        for field in table.schema
+    ]
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+
+def to_frame(table):
+    """Wraps an Arrow table in a DataFrame without copying numeric or string
+    data. The numpy arrays are read-only views of the Arrow buffers, so writing
+    into the frame in place raises instead of changing the cached table."""
+    return table.to_pandas(split_blocks=True, types_mapper=_string_types.get)
+
+
+class SharedFrameCache:
+    """Process-wide LRU cache of immutable Arrow tables.
+
+    Unlike `st.cache_data`, which hands every session its own unpickled copy,
+    each entry is held once and sessions get zero-copy DataFrame views of it.
+    Entries are evicted least recently used first once the cached tables take
+    more than `max_bytes`. Concurrent misses on the same key wait for a single
+    load instead of each fetching the extract.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bumped whenever cached data is replaced or dropped, so anything
+        # derived from the extracts can key on it
+        self.version = 0
+        self._tables = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(table.nbytes for table in self._tables.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._tables),
+                "bytes": sum(table.nbytes for table in self._tables.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "version": self.version,
+            }
+
+    def _lookup(self, key):
+        # Caller holds self._lock
+        table = self._tables.get(key)
+        if table is not None:
+            self._tables.move_to_end(key)
+            self.hits += 1
+        return table
+
+    def get(self, key, load):
+        """Returns a view of the table cached under `key`, calling `load()` for
+        a DataFrame to cache on a miss."""
+        with self._lock:
+            table = self._lookup(key)
+            if table is not None:
+                instrument.cache_lookup(True)
+                return to_frame(table)
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        with loading:
+            with self._lock:
+                table = self._lookup(key)
+            instrument.cache_lookup(table is not None)
+            if table is not None:
+                return to_frame(table)
+            try:
+                table = to_table(load())
+                with self._lock:
+                    self.misses += 1
+                self.put(key, table)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+        return to_frame(table)
+
+    def put(self, key, table):
+        with self._lock:
+            self._tables[key] = table
+            self._tables.move_to_end(key)
+            self._evict()
+
+    def update(self, key, change):
+        """Replaces the table cached under `key` with `change(table)`. Returns
+        False, doing nothing, when the key is not cached."""
+        with self._lock:
+            table = self._tables.get(key)
+        if table is None:
+            return False
+        changed = change(table)
+        with self._lock:
+            if self._tables.get(key) is not table:
+                # Reloaded or evicted meanwhile, the new copy is current
+                return False
+            self._tables[key] = changed
+            self.version += 1
+            self._evict()
+        return True
+
+    def invalidate(self, predicate):
+        """Drops every entry whose key matches `predicate`."""
+        with self._lock:
+            keys = [key for key in self._tables if predicate(key)]
+            for key in keys:
+                del self._tables[key]
+            if keys:
+                self.version += 1
+        return keys
+
+    def bump(self):
+        """Marks the data as changed without touching the cache, for extracts
+        republished while they were not cached (say evicted): what was derived
+        from the old copy is keyed on the old version and is not hit again."""
+        with self._lock:
+            self.version += 1
+
+    def _evict(self):
+        # Caller holds self._lock. The newest entry is kept even when it alone
+        # is over the ceiling, otherwise it could never be served.
+        total = sum(table.nbytes for table in self._tables.values())
+        while total > self.max_bytes and len(self._tables) > 1:
+            _, table = self._tables.popitem(last=False)
+            total -= table.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+            self.version += 1
+
+
+frames = SharedFrameCache(
+    max_bytes=int(os.environ.get("DATA_STORIES_CACHE_BYTES", 2 * 2**30))
+)
+
+
+def _binder(fn):
+    """Binds a call's arguments to every parameter of `fn`, defaults filled in,
+    so `f()`, `f(None)` and `f(x=None)` share one cache key."""
+    signature = inspect.signature(fn)
+
+    def bind(args, kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return bound
+
+    return bind
+
+
+def shared(fn):
+    """Drop-in replacement for `st.cache_data` on the extract loaders, keyed on
+    the loader name and its arguments."""
+    bind = _binder(fn)
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        bound = bind(args, kwargs)
+        key = (fn.__name__,) + tuple(bound.arguments.values())
+        return frames.get(key, lambda: fn(*bound.args, **bound.kwargs))
+
+    return wrapper
+
+
+def derived(fn):
+    """Memoizes a frame the pages derive from the extracts (filtered, pivoted,
+    ...), keyed on the dataset version and the arguments, which must be
+    hashable. It is recomputed only when the inputs or the data change; entries
+    for older versions are never hit again and age out of the LRU."""
+    bind = _binder(fn)
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        bound = bind(args, kwargs)
+        key = (fn.__name__, frames.version) + tuple(bound.arguments.values())
+        return frames.get(key, lambda: fn(*bound.args, **bound.kwargs))
+
+    return wrapper
+
+
+class SpecCache:
+    """LRU cache of chart specs (ECharts options, Vega-Lite dicts) serialized
+    to JSON, keyed by the builder, the dataset version and the chart's
+    arguments. A chart whose inputs have not changed is not rebuilt: its frame
+    is neither turned into lists of Python values nor serialized again. The
+    cached text is immutable, so sessions can share it."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._specs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._specs),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def get(self, key, build):
+        with self._lock:
+            spec = self._specs.get(key)
+            if spec is not None:
+                self._specs.move_to_end(key)
+                self.hits += 1
+                instrument.cache_lookup(True)
+                return spec
+            self.misses += 1
+        instrument.cache_lookup(False)
+        spec = build()
+        with self._lock:
+            self._specs[key] = spec
+            while len(self._specs) > self.max_entries:
+                self._specs.popitem(last=False)
+        return spec
+
+    def clear(self):
+        with self._lock:
+            self._specs.clear()
+
+
+specs = SpecCache(max_entries=256)
+
+
+def spec(fn):
+    """Caches the JSON of the spec a chart builder returns in `specs`. Keyed
+    like `derived` on the dataset version and the arguments, which must be
+    hashable: the builder loads its own frame (from a `derived` view, say), so
+    an unchanged chart costs a lookup whatever the size of its data."""
+    bind = _binder(fn)
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        bound = bind(args, kwargs)
+        key = (fn.__name__, frames.version) + tuple(bound.arguments.values())
+        return specs.get(key, lambda: json.dumps(fn(*bound.args, **bound.kwargs)))
+
+    return wrapper
@@ -0,0 +1,74 @@
+import pandas as pd
+
+# Low-cardinality text columns, stored as categoricals (dictionary encoded once
+# they are in the shared Arrow cache)
+CATEGORIES = [
+    "service_category_1",
+    "service_category_2",
+    "claim_type",
+    "condition_family",
+    "condition",
+    "provider_name",
+    "gender",
+    "race",
+    "age_group",
+]
+
+# Extracts filtered or range-indexed by year, with their "YYYY-MM" period
+# column and the integer year key derived from it, so year filters compare
+# small integers instead of slicing strings on every rerun. Only these get the
+# key, other frames go to the chart builders as loaded.
+YEAR_KEYS = {
+    "pmpm_by_service_category_1": ("year_month", "year_key"),
+    "pmpm_by_chronic_condition": ("year_month", "year_key"),
+    "condition_data": ("diagnosis_year_month", "diagnosis_year_key"),
+}
+
+# PMPM ratios are only ever shown rounded, float32's ~7 significant digits are
+# plenty. Sums and counts keep full precision since pages re-aggregate them.
+FLOAT32_SUFFIXES = ("_pmpm",)
+
+# Bytes per extract before and after compaction, see memory_report()
+sizes = {}
+
+
+def compact(name, data, record=True):
+    """Applies the dtype profile to a freshly loaded extract and, with
+    `record`, notes its memory footprint before and after."""
+    if record:
+        before = data.memory_usage(deep=True, index=False).sum()
+    data = data.copy(deep=False)
+    for col in data:
+        if col in CATEGORIES:
+            data[col] = data[col].astype("category")
+        elif col.endswith(FLOAT32_SUFFIXES) and data[col].dtype == "float64":
+            data[col] = data[col].astype("float32")
+    if name in YEAR_KEYS:
+        col, year_key = YEAR_KEYS[name]
+        year = pd.to_numeric(data[col].astype(str).str[:4], errors="coerce")
+        data[year_key] = year.fillna(0).astype("int16")
+    if record:
+        after = data.memory_usage(deep=True, index=False).sum()
+        sizes[name] = (len(data), before, after)
+    return data
+
+
+def memory_report():
+    """One row per compacted extract with its size before and after, in MB."""
+    report = pd.DataFrame(
+        [
+            (name, rows, before / 2**20, after / 2**20)
+            for name, (rows, before, after) in sizes.items()
+        ],
+        columns=["extract", "rows", "before_mb", "after_mb"],
+    )
+    report["ratio"] = report["before_mb"] / report["after_mb"]
+    return report.sort_values("before_mb", ascending=False).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    import data
+
+    for loader in data.warm_loaders:
+        loader()
+    print(memory_report().round(2).to_string(index=False))
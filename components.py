@@ -1,31 +1,26 @@
+import json
 import streamlit as st
-from streamlit_echarts import st_echarts
+import downsample
+import instrument
 import util
 import toolz as to
 from palette import PALETTE
-from PIL import Image
-
-from streamlit_extras.metric_cards import style_metric_cards
-from streamlit_extras.app_logo import add_logo as st_add_logo
 
 style_args = {"border_size_px": 0, "border_left_color": PALETTE["4-cerulean"]}
 
 
-def financial_bans(summary_stats_data, direction="horizontal"):
+@instrument.renderer
+def financial_bans(totals, direction="horizontal"):
     # TODO: Add Year filter
-    """Takes dataframe of financial summary data at the year level and displays BANs
-    for med spend, pharm spend, member months and average pmpm. Can handle dataframe with
-    multiple years or a single year. Dataframe should be pre-filtered to the time frame desired.
+    """Takes the financial summary measures summed over the time frame desired (see
+    rangesum.PrefixSumIndex.totals) and displays BANs for med spend, pharm spend,
+    member months and average pmpm.
     """
-    year_values = sorted(list(set(summary_stats_data["year"])))
-    summary_stats_data = summary_stats_data.copy(deep=True)
-    summary_stats_data = summary_stats_data.loc[
-        summary_stats_data["year"].isin(year_values)
-    ]
+    from streamlit_extras.metric_cards import style_metric_cards
 
-    med_spend = summary_stats_data["current_period_medical_paid"].sum()
-    # pharm_spend = summary_stats_data["current_period_pharmacy_paid"].sum()
-    member_mon_count = summary_stats_data["current_period_member_months"].sum()
+    med_spend = totals["current_period_medical_paid"]
+    # pharm_spend = totals["current_period_pharmacy_paid"]
+    member_mon_count = totals["current_period_member_months"]
     avg_pmpm = med_spend / member_mon_count
     if direction == "vertical":
         st.metric("Medical Spend", util.human_format(med_spend))
@@ -62,14 +57,9 @@ def year_slider(year_values):
     return selected_range
 
 
-def claim_type_line_chart(df, height="300px", animated=True):
-    if animated:
-        t = st.session_state["iteration"]
-        month_list = sorted(list(set(df["year_month"])))
-        anim_data = df.loc[df["year_month"] <= month_list[t], :]
-        list_data = [anim_data.columns.to_list()] + anim_data.values.tolist()
-    else:
-        list_data = [df.columns.to_list()] + df.values.tolist()
+def claim_type_line_chart_option(df, animated):
+    df = downsample.frame(df, "year_month", "paid_amount_pmpm", by="claim_type")
+    list_data = [df.columns.to_list()] + df.values.tolist()
     series = list(set(df["claim_type"]))
     datasetWithFilters = [
         {
@@ -120,10 +110,47 @@ def claim_type_line_chart(df, height="300px", animated=True):
         "grid": {"right": 140},
         "series": seriesList,
     }
-    st_echarts(options=option, height=height, key="chart")
+    if animated:
+        # An ECharts timeline played by the browser. The dataset is sent once
+        # and each frame only moves the end of the x axis on by a month.
+        month_list = sorted(list(set(df["year_month"])))
+        option["xAxis"]["data"] = month_list
+        option = {
+            "baseOption": {
+                **option,
+                "timeline": {
+                    "show": False,
+                    "axisType": "category",
+                    "data": month_list,
+                    "autoPlay": True,
+                    "loop": False,
+                    "playInterval": 50,
+                },
+            },
+            "options": [{"xAxis": {"max": i}} for i in range(len(month_list))],
+        }
+    return option
+
+
+@instrument.renderer
+def echarts(option, height="300px", key=None):
+    """Renders an ECharts option, the JSON a `cache.spec` builder returns."""
+    # Chart components are imported on first render, pages without them
+    # start faster
+    from streamlit_echarts import st_echarts
 
+    # st_echarts only takes a dict. Each run decodes its own, which is cheaper
+    # than rebuilding it and never changes the text sessions share.
+    st_echarts(options=json.loads(option), height=height, key=key)
 
-def pop_grouped_bar(df):
+
+@instrument.renderer
+def vega_lite_chart(spec):
+    """Renders a Vega-Lite spec, the JSON a `cache.spec` builder returns."""
+    st.vega_lite_chart(json.loads(spec), use_container_width=True)
+
+
+def pop_grouped_bar_option(df):
     pivoted_df = (
         df.pivot(index="category", columns="display", values="current_period_pmpm")
         .reset_index()
@@ -145,16 +172,16 @@ def pop_grouped_bar(df):
         "yAxis": {"type": "value"},
         "series": [{"type": "bar"} for x in list(set(df["display"]))],
     }
-    st_echarts(options=option)
+    return option
 
 
-def generic_simple_v_bar(df, x, y, title, color=None, height="300px", top_n=None):
+def generic_simple_v_bar_option(df, x, y, title, color=None, top_n=None):
     if color is None:
         color = ""
-    df.sort_values(by=x, inplace=True, ascending=False)
+    # New frames, the caller's is left as it was
     if top_n:
-        df = df.head(top_n)
-    df.sort_values(by=x, inplace=True, ascending=True)
+        df = df.nlargest(top_n, x)
+    df = df.sort_values(by=x, ascending=True)
     options = {
         "xAxis": {"type": "value"},
         "yAxis": {"type": "category", "data": df[y].tolist()},
@@ -163,10 +190,12 @@ def generic_simple_v_bar(df, x, y, title, color=None, height="300px", top_n=None
         "tooltip": {"position": "top"},
         "grid": {"containLabel": True},
     }
-    st_echarts(options=options, height=height)
+    return options
 
 
 def add_logo():
+    from streamlit_extras.app_logo import add_logo as st_add_logo
+
     st_add_logo(
         "https://tuva-public-resources.s3.amazonaws.com/TuvaHealth-Logo-45h.png",
         height=100,
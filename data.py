@@ -1,35 +1,77 @@
-import streamlit as st
-import pandas as pd
-import dask.dataframe as dd
+import contextvars
+import inspect
+import os
+import cache
+import compact
+import engine
+import extracts
+import instrument
+import schemas
 import util
 
-conn = util.connection(database="dev_lipsa")
-s3_uri = "s3://tuva-public-resources/data-extracts/lds/"
+# Set DATA_STORIES_LIVE=1 to run each loader's query instead of reading the
+# published extract, on Snowflake or the local DuckDB engine (see engine.py).
+# Neither connects until the first query runs.
+live = os.environ.get("DATA_STORIES_LIVE") == "1"
 
-global_converters = {"year": str}
 
+def run_query(query):
+    table = engine.current().arrow(query)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
 
-@st.cache_data
+
+# Partition directories to read instead of the whole extract, set while
+# refresh.py reloads the periods that changed
+_partitions = contextvars.ContextVar("partitions", default=None)
+
+
+def load(name, query):
+    partitions = _partitions.get()
+    if partitions is not None:
+        data = extracts.read_partition_dirs(name, partitions)
+    elif live:
+        data = run_query(query)
+    else:
+        data = extracts.read(name)
+    with instrument.span("compact", name):
+        return compact.compact(name, data, record=partitions is None)
+
+
+def load_partitions(loader, partitions):
+    """Runs a zero-argument loader, bypassing the cache, over only the given
+    partitions of its extract. The rows come back with the same clean-up and
+    derived columns as a full load."""
+    token = _partitions.set(partitions)
+    try:
+        return inspect.unwrap(loader)()
+    finally:
+        _partitions.reset(token)
+
+
+@instrument.loader
+@cache.shared
 def test_results():
     query = """
     select * from data_profiling.test_result
     """
 
-    data = pd.read_csv(s3_uri + "test_results.csv")
+    data = load("test_results", query)
     return data
 
 
-@st.cache_data
+@instrument.loader
+@cache.shared
 def use_case():
     query = """
     select * from data_profiling.use_case
     """
 
-    data = pd.read_csv(s3_uri + "use_case.csv")
+    data = load("use_case", query)
     return data
 
 
-@st.cache_data
+@instrument.loader
+@cache.shared
 def cost_summary():
     query = """
         select *
@@ -37,11 +79,12 @@ def cost_summary():
         order by 1, 2, 3
     """
 
-    data = pd.read_csv(s3_uri + "cost_summary.csv")
+    data = load("cost_summary", query)
     return data
 
 
-@st.cache_data
+@instrument.loader
+@cache.shared
 def year_months():
     query = """
         select distinct
@@ -55,11 +98,12 @@ def year_months():
         order by 1
     """
 
-    data = pd.read_csv(s3_uri + "year_months.csv")
+    data = load("year_months", query)
     return data
 
 
-@st.cache_data
+@instrument.loader
+@cache.shared
 def summary_stats():
     query = """
     with medical as (
@@ -82,28 +126,29 @@ def summary_stats():
         concat(year, 'Q', quarter) as display
         , year
         , quarter
-        , lag(quarter) over(order by quarter) as prior_quarter
+        , lag(quarter) over(order by year, quarter) as prior_quarter
         , medical_paid_amount as current_period_medical_paid
-        , lag(medical_paid_amount) over(order by quarter) as prior_period_medical_paid
+        , lag(medical_paid_amount) over(order by year, quarter) as prior_period_medical_paid
         , div0null(
-             medical_paid_amount - lag(medical_paid_amount) over(order by quarter),
-             lag(medical_paid_amount) over(order by quarter)
+             medical_paid_amount - lag(medical_paid_amount) over(order by year, quarter),
+             lag(medical_paid_amount) over(order by year, quarter)
           ) as pct_change_medical_paid
         , member_month_count as current_period_member_months
-        , lag(member_month_count) over(order by quarter) as prior_period_member_months
+        , lag(member_month_count) over(order by year, quarter) as prior_period_member_months
         , div0null(
-             member_month_count - lag(member_month_count) over(order by quarter),
-             lag(member_month_count) over(order by quarter)
+             member_month_count - lag(member_month_count) over(order by year, quarter),
+             lag(member_month_count) over(order by year, quarter)
         ) as pct_change_member_months
     from medical
     join elig using(year, quarter)
     """
 
-    data = pd.read_csv(s3_uri + "summary_stats.csv", converters=global_converters)
+    data = load("summary_stats", query)
     return data
 
 
-@st.cache_data
+@instrument.loader
+@cache.shared
 def pmpm_by_claim_type():
     query = """
         with spend_summary as (
@@ -143,23 +188,36 @@ def pmpm_by_claim_type():
         join elig using(year_month)
     """
 
-    data = pd.read_csv(s3_uri + "pmpm_by_claim_type.csv", converters=global_converters)
+    data = load("pmpm_by_claim_type", query)
     return data
 
 
-@st.cache_data
+@instrument.loader
+@cache.shared
 def pmpm_by_service_category_1():
     query = """
-        with spend_summary as (
+        with medical_claims as (
             select
-               year(claim_end_date)::text || '-' ||
-                 lpad(month(claim_end_date)::text, 2, '0')
+               year(c.claim_end_date)::text || '-' ||
+                 lpad(month(c.claim_end_date)::text, 2, '0')
                  as year_month
+               , c.claim_id
+               , c.patient_id
+               , c.claim_end_date
+               , c.claim_type
+               , c.rendering_npi
+               , c.paid_amount
+               , service_category_1
+               , service_category_2
+            from core.medical_claim c
+            left join service_category.service_category_grouper using(claim_id)
+        ), spend_summary as (
+            select
+               year_month
                , service_category_1
                , sum(paid_amount) as paid_amount_sum
                , count(*) as row_count
-            from core.medical_claim
-            left join service_category.service_category_grouper using(claim_id)
+            from medical_claims
             group by 1, 2
             having sum(paid_amount) > 0
             order by 1, 2 desc
@@ -176,24 +234,37 @@ def pmpm_by_service_category_1():
         join elig using(year_month)
     """
 
-    data = pd.read_csv(s3_uri + "pmpm_by_service_category_1.csv")
+    data = load("pmpm_by_service_category_1", query)
     return data
 
 
-@st.cache_data
+@instrument.loader
+@cache.shared
 def pmpm_by_service_category_1_2():
     query = """
-        with spend_summary as (
+        with medical_claims as (
             select
-               year(claim_end_date)::text || '-' ||
-                 lpad(month(claim_end_date)::text, 2, '0')
+               year(c.claim_end_date)::text || '-' ||
+                 lpad(month(c.claim_end_date)::text, 2, '0')
                  as year_month
+               , c.claim_id
+               , c.patient_id
+               , c.claim_end_date
+               , c.claim_type
+               , c.rendering_npi
+               , c.paid_amount
+               , service_category_1
+               , service_category_2
+            from core.medical_claim c
+            left join service_category.service_category_grouper using(claim_id)
+        ), spend_summary as (
+            select
+               year_month
                , service_category_1
                , service_category_2
                , sum(paid_amount) as paid_amount_sum
                , count(*) as row_count
-            from core.medical_claim
-            left join service_category.service_category_grouper using(claim_id)
+            from medical_claims
             group by 1, 2, 3
             having sum(paid_amount) > 0
             order by 1, 2, 3 desc
@@ -210,24 +281,39 @@ def pmpm_by_service_category_1_2():
         join elig using(year_month)
     """
 
-    data = pd.read_csv(s3_uri + "pmpm_by_service_category_1_2.csv")
+    data = load("pmpm_by_service_category_1_2", query)
     return data
 
 
-@st.cache_data
-def pmpm_by_service_category_1_provider(service_cat, year_month):
+@instrument.loader
+@cache.shared
+def pmpm_by_service_category_1_provider(
+    service_cat=None, year_month="All Time", top_n=None
+):
     query = """
-        with spend_summary as (
+        with medical_claims as (
             select
-               year(claim_end_date)::text || '-' ||
-                 lpad(month(claim_end_date)::text, 2, '0')
+               year(c.claim_end_date)::text || '-' ||
+                 lpad(month(c.claim_end_date)::text, 2, '0')
                  as year_month
+               , c.claim_id
+               , c.patient_id
+               , c.claim_end_date
+               , c.claim_type
+               , c.rendering_npi
+               , c.paid_amount
+               , service_category_1
+               , service_category_2
+            from core.medical_claim c
+            left join service_category.service_category_grouper using(claim_id)
+        ), spend_summary as (
+            select
+               year_month
                , service_category_1
                , p.provider_name
                , sum(paid_amount) as paid_amount_sum
                , count(*) as row_count
-            from core.medical_claim c
-            left join service_category.service_category_grouper using(claim_id)
+            from medical_claims c
             left join core.provider p
             on c.rendering_npi = p.npi
             group by 1, 2, 3
@@ -245,8 +331,50 @@ def pmpm_by_service_category_1_provider(service_cat, year_month):
         from spend_summary
         join elig using(year_month)
     """
-    data_path = s3_uri + "pmpm_by_service_category_1_provider.csv"
-    data = dd.read_csv(data_path, storage_options={"anon": True})
+    name = "pmpm_by_service_category_1_provider"
+    if service_cat is None:
+        # The whole extract, ungrouped, for the drilldown cube
+        return load(name, query)
+    filters = {"service_category_1": service_cat}
+    if year_month != "All Time":
+        filters["year_month"] = year_month
+    if live:
+        data = run_query(query)
+        data = data.loc[
+            ((data["year_month"] == year_month) | (year_month == "All Time"))
+            & (data["service_category_1"] == service_cat)
+        ]
+    else:
+        try:
+            data = extracts.read_partitions(name, filters)
+        except FileNotFoundError:
+            data = None
+    if data is not None:
+        data = compact.compact(name, data).drop("service_category_1", axis=1)
+        with instrument.span("aggregate", name):
+            return util.group_for_pmpm(data, "provider_name", top_n)
+
+    # No partitioned copy published yet, scan the whole extract
+    import dask.dataframe as dd
+
+    columns = extracts.EXTRACTS[name]["columns"]
+    try:
+        path, storage_options = extracts.local_copy(
+            extracts.base_uri + name + ".parquet"
+        )
+        data = dd.read_parquet(path, columns=columns, storage_options=storage_options)
+    except FileNotFoundError:
+        path, compression = extracts.csv_copy(name)
+        path, storage_options = extracts.local_copy(path)
+        data = dd.read_csv(
+            path,
+            usecols=columns,
+            dtype=schemas.dtypes(name, columns),
+            compression=compression,
+            # Compressed files cannot be split into blocks
+            blocksize=None if compression else "default",
+            storage_options=storage_options,
+        )
     data = (
         data.loc[
             ((data["year_month"] == year_month) | (year_month == "All Time"))
@@ -256,24 +384,38 @@ def pmpm_by_service_category_1_provider(service_cat, year_month):
         .reset_index(drop=True)
     )
 
-    grouped = util.group_for_pmpm(data, "provider_name")
-    return grouped.compute()
+    grouped = util.group_for_pmpm(data, "provider_name", top_n)
+    with instrument.span("compute", name):
+        return grouped.compute()
 
 
-@st.cache_data
+@instrument.loader
+@cache.shared
 def pmpm_by_service_category_1_condition():
     query = """
-        with spend_summary as (
+        with medical_claims as (
             select
-               year(claim_end_date)::text || '-' ||
-                 lpad(month(claim_end_date)::text, 2, '0')
+               year(c.claim_end_date)::text || '-' ||
+                 lpad(month(c.claim_end_date)::text, 2, '0')
                  as year_month
+               , c.claim_id
+               , c.patient_id
+               , c.claim_end_date
+               , c.claim_type
+               , c.rendering_npi
+               , c.paid_amount
+               , service_category_1
+               , service_category_2
+            from core.medical_claim c
+            left join service_category.service_category_grouper using(claim_id)
+        ), spend_summary as (
+            select
+               year_month
                , service_category_1
                , cc.condition_family
                , sum(paid_amount) as paid_amount_sum
                , count(*) as row_count
-            from core.medical_claim mc
-            left join service_category.service_category_grouper using(claim_id)
+            from medical_claims mc
             left join chronic_conditions.tuva_chronic_conditions_long cc
             on mc.patient_id = cc.patient_id
             and cc.last_diagnosis_date >= mc.claim_end_date
@@ -294,24 +436,37 @@ def pmpm_by_service_category_1_condition():
         join elig using(year_month)
     """
 
-    data = pd.read_csv(s3_uri + "pmpm_by_service_category_1_condition.csv")
+    data = load("pmpm_by_service_category_1_condition", query)
     return data
 
 
-@st.cache_data
+@instrument.loader
+@cache.shared
 def pmpm_by_service_category_1_claim_type():
     query = """
-        with spend_summary as (
+        with medical_claims as (
             select
-               year(claim_end_date)::text || '-' ||
-                 lpad(month(claim_end_date)::text, 2, '0')
+               year(c.claim_end_date)::text || '-' ||
+                 lpad(month(c.claim_end_date)::text, 2, '0')
                  as year_month
+               , c.claim_id
+               , c.patient_id
+               , c.claim_end_date
+               , c.claim_type
+               , c.rendering_npi
+               , c.paid_amount
+               , service_category_1
+               , service_category_2
+            from core.medical_claim c
+            left join service_category.service_category_grouper using(claim_id)
+        ), spend_summary as (
+            select
+               year_month
                , service_category_1
                , claim_type
                , sum(paid_amount) as paid_amount_sum
                , count(*) as row_count
-            from core.medical_claim c
-            left join service_category.service_category_grouper using(claim_id)
+            from medical_claims
             group by 1, 2, 3
             having sum(paid_amount) > 0
             order by 1, 2, 3 desc
@@ -328,11 +483,12 @@ def pmpm_by_service_category_1_claim_type():
         join elig using(year_month)
     """
 
-    data = pd.read_csv(s3_uri + "pmpm_by_service_category_1_claim_type.csv")
+    data = load("pmpm_by_service_category_1_claim_type", query)
     return data
 
 
-@st.cache_data
+@instrument.loader
+@cache.shared
 def pmpm_data():
     query = """SELECT PT.*, PB.MEMBER_COUNT, PHARMACY_SPEND FROM PMPM.PMPM_TRENDS PT
               LEFT JOIN (SELECT CONCAT(LEFT(YEAR_MONTH, 4), '-', RIGHT(YEAR_MONTH, 2)) AS YEAR_MONTH,
@@ -342,31 +498,33 @@ def pmpm_data():
                          GROUP BY YEAR_MONTH) AS PB
               ON PT.YEAR_MONTH = PB.YEAR_MONTH;"""
 
-    data = pd.read_csv(s3_uri + "pmpm_data.csv")
+    data = load("pmpm_data", query)
     # data["year_month"] = pd.to_datetime(data["year_month"], format="%Y-%m").dt.date
     data["year"] = data["year_month"].str[:4]
-    data["pharmacy_spend"] = data["pharmacy_spend"].astype(float)
 
     return data
 
 
-@st.cache_data
+@instrument.loader
+@cache.shared
 def gender_data():
     query = """SELECT GENDER, COUNT(*) AS COUNT FROM CORE.PATIENT GROUP BY 1;"""
 
-    data = pd.read_csv(s3_uri + "gender_data.csv")
+    data = load("gender_data", query)
     return data
 
 
-@st.cache_data
+@instrument.loader
+@cache.shared
 def race_data():
     query = """SELECT RACE, COUNT(*) AS COUNT FROM CORE.PATIENT GROUP BY 1;"""
 
-    data = pd.read_csv(s3_uri + "race_data.csv")
+    data = load("race_data", query)
     return data
 
 
-@st.cache_data
+@instrument.loader
+@cache.shared
 def age_data():
     query = """SELECT CASE
                         WHEN div0(current_date() - BIRTH_DATE, 365) < 49 THEN '34-48'
@@ -380,11 +538,12 @@ def age_data():
                 GROUP BY 1
                 ORDER BY 1;"""
 
-    data = pd.read_csv(s3_uri + "age_data.csv")
+    data = load("age_data", query)
     return data
 
 
-@st.cache_data
+@instrument.loader
+@cache.shared
 def pmpm_by_chronic_condition():
     query = """
         with conditions as (
@@ -428,11 +587,12 @@ def pmpm_by_chronic_condition():
         order by 2, 1
     """
 
-    data = pd.read_csv(s3_uri + "pmpm_by_chronic_condition.csv")
+    data = load("pmpm_by_chronic_condition", query)
     return data
 
 
-@st.cache_data
+@instrument.loader
+@cache.shared
 def condition_data():
     query = """SELECT
                 CONCAT(date_part(year, FIRST_DIAGNOSIS_DATE), '-', lpad(date_part(month, FIRST_DIAGNOSIS_DATE), 2, 0)) AS DIAGNOSIS_YEAR_MONTH,
@@ -443,8 +603,27 @@ def condition_data():
               GROUP BY 1,2
               ORDER BY 3 DESC;"""
 
-    data = pd.read_csv(s3_uri + "condition_data.csv")
-    data["diagnosis_year"] = pd.to_datetime(
-        data["diagnosis_year_month"]
-    ).dt.year.astype(str)
+    data = load("condition_data", query)
+    data["diagnosis_year"] = data["diagnosis_year_month"].str[:4]
     return data
+
+
+# Loaders the warm-up fetches in the background when a server process starts,
+# see warmup.py. The provider drilldown is per selection and is left out.
+warm_loaders = [
+    year_months,
+    pmpm_by_claim_type,
+    summary_stats,
+    pmpm_by_service_category_1,
+    pmpm_by_service_category_1_2,
+    pmpm_by_service_category_1_condition,
+    pmpm_by_service_category_1_claim_type,
+    use_case,
+    test_results,
+    pmpm_data,
+    gender_data,
+    race_data,
+    age_data,
+    pmpm_by_chronic_condition,
+    condition_data,
+]
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+# Points kept per series when the caller does not give the chart's width. A
+# line chart cannot show more distinct points than it has pixel columns, this
+# is about the widest chart on a wide layout page.
+WIDTH = 1000
+
+
+def lttb(x, y, points):
+    """Largest-Triangle-Three-Buckets: the positions of `points` samples of
+    the series (x, y) that best keep its visual shape. The first and last
+    samples are always kept."""
+    n = len(y)
+    if points >= n or points < 3:
+        return np.arange(n)
+    # points - 2 buckets between the fixed first and last samples
+    edges = np.linspace(1, n - 1, points - 1).astype(int)
+    keep = np.empty(points, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        after = edges[i + 2] if i + 2 < len(edges) else n
+        # The triangle's third corner is the average of the next bucket
+        avg_x, avg_y = x[end:after].mean(), y[end:after].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+
+def minmax(x, y, points):
+    """Min/max bucketing: the positions of the lowest and highest sample in
+    each of `points` / 2 buckets, so every peak and trough survives. The
+    first and last samples are always kept."""
+    n = len(y)
+    if points >= n or points < 4:
+        return np.arange(n)
+    buckets = (points - 2) // 2
+    bucket = np.arange(n) * buckets // n
+    order = np.lexsort((y, bucket))
+    starts = np.searchsorted(bucket[order], np.arange(buckets))
+    ends = np.append(starts[1:], n)
+    keep = np.concatenate([[0, n - 1], order[starts], order[ends - 1]])
+    return np.unique(keep)
+
+
+METHODS = {"lttb": lttb, "minmax": minmax}
+
+
+def _positions(values):
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype="float64")
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy(dtype="datetime64[ns]").astype("int64").astype("float64")
+    # Labels such as "YYYY-MM" or "YYYY-MM-DD" are evenly spaced periods
+    return np.arange(len(values), dtype="float64")
+
+
+def frame(df, x, y, by=None, width=WIDTH, method="lttb"):
+    """Downsamples the line chart data in `df` to at most `width` points per
+    series, the series being the groups of `by` (or the whole frame). Rows
+    come back sorted by `x`, series with `width` points or fewer unchanged."""
+    df = df.sort_values(x)
+    groups = [df] if by is None else [g for _, g in df.groupby(by, observed=True)]
+    if all(len(g) <= width for g in groups):
+        return df
+    sample = METHODS[method]
+    kept = [
+        g.iloc[
+            sample(
+                _positions(g[x]),
+                g[y].to_numpy(dtype="float64", na_value=0),
+                width,
+            )
+        ]
+        for g in groups
+    ]
+    return pd.concat(kept).sort_values(x)
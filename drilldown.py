@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import cache
+import data
+import instrument
+
+log = logging.getLogger(__name__)
+
+# Breakdowns shown under the service category chart, by the extract (loader)
+# they are grouped from
+DIMENSIONS = {
+    "service_category_2": data.pmpm_by_service_category_1_2,
+    "condition_family": data.pmpm_by_service_category_1_condition,
+    "provider_name": data.pmpm_by_service_category_1_provider,
+    "claim_type": data.pmpm_by_service_category_1_claim_type,
+}
+
+# Breakdowns charted as a top N by PMPM, only those rows are kept
+TOP_N = {
+    "condition_family": 5,
+    "provider_name": 10,
+}
+
+MEASURES = ["paid_amount_sum", "member_month_count", "row_count"]
+
+ALL_TIME = "All Time"
+
+
+def rollup(frame, dimension, top_n=None):
+    """`util.group_for_pmpm` for every (service_category_1, year_month) and
+    (service_category_1, All Time) selection at once: the grouping sets
+    (service_category_1, year_month, dimension) and (service_category_1,
+    dimension). The extract is grouped once, All Time is rolled up from the
+    monthly sums. With `top_n`, only the top rows of each selection are kept."""
+    months = (
+        frame.groupby(
+            ["service_category_1", "year_month", dimension], observed=True, sort=False
+        )[MEASURES]
+        .sum()
+        .reset_index()
+    )
+    all_time = (
+        months.groupby(["service_category_1", dimension], observed=True, sort=False)[
+            MEASURES
+        ]
+        .sum()
+        .reset_index()
+    )
+    all_time.insert(1, "year_month", ALL_TIME)
+    cells = pd.concat([months, all_time], ignore_index=True)
+    cells["year_month"] = cells["year_month"].astype(str)
+    cells = cells.loc[cells["row_count"] > 10]
+    cells = cells.assign(
+        paid_amount_pmpm=cells["paid_amount_sum"] / cells["member_month_count"]
+    )
+    # group_for_pmpm's row order, by dimension within each selection
+    cells = cells.sort_values(["service_category_1", "year_month", dimension])
+    if top_n:
+        # nlargest per selection, which keeps the selections contiguous and
+        # breaks ties in the same order group_for_pmpm does
+        top = cells.groupby(
+            ["service_category_1", "year_month"], observed=True, sort=False
+        )["paid_amount_pmpm"].nlargest(top_n)
+        cells = cells.loc[top.index.get_level_values(-1)]
+    return cells
+
+
+class DrilldownCube:
+    """The drilldown breakdowns for every service category and month, computed
+    once per dataset version. Each breakdown is one Arrow table sorted by
+    selection, so a lookup is a dictionary hit and a zero-copy slice."""
+
+    def __init__(self, version):
+        self.version = version
+        self.tables = {}
+        self.index = {}
+        self.build_seconds = {}
+
+    @classmethod
+    def build(cls, version, dimensions=None):
+        cube = cls(version)
+        for dimension, loader in (dimensions or DIMENSIONS).items():
+            start = time.perf_counter()
+            cells = rollup(loader(), dimension, TOP_N.get(dimension))
+            index = {}
+            keys = cells[["service_category_1", "year_month"]].astype(str)
+            bounds = np.flatnonzero(
+                (keys.iloc[1:].values != keys.iloc[:-1].values).any(axis=1)
+            )
+            starts = np.concatenate([[0], bounds + 1])
+            ends = np.concatenate([bounds + 1, [len(cells)]])
+            for start_row, end_row in zip(starts, ends):
+                if end_row > start_row:
+                    index[tuple(keys.iloc[start_row])] = (
+                        start_row,
+                        end_row - start_row,
+                    )
+            cells = cells[[dimension] + MEASURES + ["paid_amount_pmpm"]]
+            # Plain strings: a slice of a dictionary column would bring the
+            # whole dictionary (every provider) back to pandas with it
+            cells = cells.astype({dimension: str})
+            cube.tables[dimension] = cache.to_table(cells)
+            cube.index[dimension] = index
+            cube.build_seconds[dimension] = time.perf_counter() - start
+        return cube
+
+    def lookup(self, dimension, service_cat, year_month):
+        """The breakdown of `service_cat` in `year_month` (or "All Time") by
+        `dimension`, as `util.group_for_pmpm` would return it."""
+        start, length = self.index[dimension].get((service_cat, year_month), (0, 0))
+        return cache.to_frame(self.tables[dimension].slice(start, length))
+
+    @property
+    def nbytes(self):
+        return sum(table.nbytes for table in self.tables.values())
+
+    def memory_report(self):
+        """One row per breakdown with its cells, selections, size and build
+        time."""
+        return pd.DataFrame(
+            [
+                (
+                    dimension,
+                    table.num_rows,
+                    len(self.index[dimension]),
+                    table.nbytes / 2**20,
+                    self.build_seconds[dimension],
+                )
+                for dimension, table in self.tables.items()
+            ],
+            columns=["dimension", "cells", "selections", "mb", "build_seconds"],
+        )
+
+
+_cube = None
+_lock = threading.Lock()
+
+
+@instrument.loader
+def cube():
+    """The cube for the current dataset version, rebuilt after the shared
+    cache's contents change (see cache.SharedFrameCache.version)."""
+    global _cube
+    with _lock:
+        version = cache.frames.version
+        if _cube is None or _cube.version != version:
+            _cube = DrilldownCube.build(version)
+            log.info(
+                "built drilldown cube for version %d: %.1f MB",
+                version,
+                _cube.nbytes / 2**20,
+            )
+        return _cube
+
+
+if __name__ == "__main__":
+    print(cube().memory_report().round(2).to_string(index=False))
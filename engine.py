@@ -0,0 +1,257 @@
+import ast
+import os
+import re
+import sys
+import threading
+
+import pyarrow as pa
+
+import extracts
+import util
+
+# Snowflake functions DuckDB lacks, defined as macros on every connection
+MACROS = [
+    "create or replace macro div0(a, b) as case when b = 0 then 0 else a / b end",
+    "create or replace macro div0null(a, b) as "
+    "case when b is null or b = 0 then 0 else a / b end",
+]
+
+DATE_FORMATS = [
+    ("YYYY", "%Y"),
+    ("MM", "%m"),
+    ("DD", "%d"),
+    ("HH24", "%H"),
+    ("MI", "%M"),
+]
+
+# Words that can follow a `::type` cast without being an implicit alias
+_KEYWORDS = {"as", "from", "end", "then", "else", "when", "and", "or", "over", "is"}
+
+
+def _split_args(body):
+    args, depth, quoted, start = [], 0, False, 0
+    for i, char in enumerate(body):
+        if char == "'":
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            args.append(body[start:i].strip())
+            start = i + 1
+    args.append(body[start:].strip())
+    return args
+
+
+def rewrite_calls(sql, name, rewrite):
+    """Replaces every `name(arg, ...)` call in `sql` with `rewrite(args)`,
+    rewriting nested calls first."""
+    pattern = re.compile(rf"\b{name}\s*\(", re.IGNORECASE)
+    out, pos = [], 0
+    while True:
+        match = pattern.search(sql, pos)
+        if match is None:
+            out.append(sql[pos:])
+            return "".join(out)
+        depth, quoted, end = 1, False, match.end()
+        while depth:
+            char = sql[end]
+            if char == "'":
+                quoted = not quoted
+            elif not quoted and char == "(":
+                depth += 1
+            elif not quoted and char == ")":
+                depth -= 1
+            end += 1
+        body = rewrite_calls(sql[match.end() : end - 1], name, rewrite)
+        out.append(sql[pos : match.start()])
+        out.append(rewrite(_split_args(body)))
+        pos = end
+
+
+def _to_date(args):
+    if len(args) == 1:
+        return f"cast({args[0]} as date)"
+    fmt = args[1]
+    for snowflake, strftime in DATE_FORMATS:
+        fmt = fmt.replace(snowflake, strftime)
+    return f"cast(strptime({args[0]}, {fmt}) as date)"
+
+
+def _substr(args):
+    # Snowflake treats a start position of 0 as 1
+    if args[1] == "0":
+        args[1] = "1"
+    return f"substr({', '.join(args)})"
+
+
+def _lpad(args):
+    text = ", ".join([f"cast({args[0]} as varchar)", args[1]])
+    if len(args) > 2:
+        text += f", cast({args[2]} as varchar)"
+    return f"lpad({text})"
+
+
+def _date_part(args):
+    unit = args[0].strip("'\"").lower()
+    return f"date_part('{unit}', {args[1]})"
+
+
+def _implicit_alias(match):
+    if match.group(2).lower() in _KEYWORDS:
+        return match.group(0)
+    return f"{match.group(1)} as {match.group(2)}"
+
+
+def translate(query):
+    """Rewrites the Snowflake dialect used by the data.py queries into DuckDB
+    SQL. div0 and div0null are provided as macros instead."""
+    sql = query.strip().rstrip(";")
+    sql = rewrite_calls(sql, "to_date", _to_date)
+    sql = rewrite_calls(sql, "substr", _substr)
+    sql = rewrite_calls(sql, "lpad", _lpad)
+    sql = rewrite_calls(sql, "date_part", _date_part)
+    # `year(x)::text year` -> `year(x)::text as year`, DuckDB requires the AS
+    sql = re.sub(r"(::\w+)\s+([a-z_]\w*)\b(?!\s*\()", _implicit_alias, sql, flags=re.I)
+    return sql
+
+
+class SnowflakeEngine:
+    def __init__(self, database=None):
+        self.pool = util.pool(database)
+
+    def arrow(self, query):
+        return util.safe_to_arrow(self.pool, query)
+
+
+class DuckDBEngine:
+    """Runs the loader queries with DuckDB over local parquet copies of the raw
+    Tuva tables, laid out as `<raw_dir>/<schema>/<table>.parquet` (or a
+    `<table>/` directory of parquet files). DuckDB executes vectorized and on
+    `threads` threads (all cores by default)."""
+
+    def __init__(self, raw_dir, threads=None):
+        import duckdb
+
+        self.raw_dir = raw_dir
+        self.conn = duckdb.connect()
+        if threads:
+            self.conn.execute(f"set threads = {int(threads)}")
+        for macro in MACROS:
+            self.conn.execute(macro)
+        for schema in sorted(os.listdir(raw_dir)):
+            schema_dir = os.path.join(raw_dir, schema)
+            if not os.path.isdir(schema_dir):
+                continue
+            self.conn.execute(f'create schema if not exists "{schema}"')
+            for entry in sorted(os.listdir(schema_dir)):
+                path = os.path.join(schema_dir, entry)
+                table = entry.removesuffix(".parquet")
+                if os.path.isdir(path):
+                    path = os.path.join(path, "*.parquet")
+                elif not entry.endswith(".parquet"):
+                    continue
+                self.conn.execute(
+                    f'create view "{schema}"."{table}" as '
+                    f"select * from read_parquet('{path}')"
+                )
+
+    def arrow(self, query):
+        # One cursor per call so loaders can run from several threads
+        cursor = self.conn.cursor()
+        try:
+            table = cursor.execute(translate(query)).arrow()
+            if hasattr(table, "read_all"):
+                # DuckDB 1.4+ returns a RecordBatchReader
+                table = table.read_all()
+        finally:
+            cursor.close()
+        return util.normalize_arrow(_snowflake_numbers(table))
+
+    def materialize(self, table, query):
+        """Stores the result of `query` as `table`, which later queries on any
+        thread can read, see build.py."""
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f'create or replace table "{table}" as {translate(query)}')
+        finally:
+            cursor.close()
+
+    def drop(self, table):
+        self.conn.execute(f'drop table if exists "{table}"')
+
+
+def _snowflake_numbers(table):
+    # DuckDB sums integers into HUGEINT, which arrives as decimal128. Snowflake
+    # hands NUMBER(p, 0) over as int64 and scaled numbers as float64, do the same.
+    for i, field in enumerate(table.schema):
+        if pa.types.is_decimal(field.type):
+            target = pa.int64() if field.type.scale == 0 else pa.float64()
+            table = table.set_column(i, field.name, table.column(i).cast(target))
+    return table
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def current():
+    """The engine live loaders run on: DATA_STORIES_ENGINE=duckdb runs against
+    the raw tables under DATA_STORIES_RAW_DIR, anything else on Snowflake."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            if os.environ.get("DATA_STORIES_ENGINE") == "duckdb":
+                _engine = DuckDBEngine(
+                    os.environ["DATA_STORIES_RAW_DIR"],
+                    os.environ.get("DATA_STORIES_THREADS"),
+                )
+            else:
+                _engine = SnowflakeEngine(database="dev_lipsa")
+        return _engine
+
+
+def extract_queries(path=None):
+    """Returns {extract name: query} for the loaders in data.py, read from the
+    source so the queries do not have to be run or duplicated."""
+    path = path or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data.py")
+    with open(path) as fp:
+        tree = ast.parse(fp.read())
+    queries = {}
+    for node in tree.body:
+        if not isinstance(node, ast.FunctionDef):
+            continue
+        query = name = None
+        for child in ast.walk(node):
+            if isinstance(child, ast.Assign) and isinstance(child.value, ast.Constant):
+                targets = [t.id for t in child.targets if isinstance(t, ast.Name)]
+                if "query" in targets:
+                    query = child.value.value
+                elif "name" in targets:
+                    name = child.value.value
+            elif (
+                isinstance(child, ast.Call)
+                and getattr(child.func, "id", None) == "load"
+                and child.args
+                and isinstance(child.args[0], ast.Constant)
+            ):
+                name = child.args[0].value
+        if query and name:
+            queries[name] = query
+    return queries
+
+
+def rebuild(engine, uri):
+    """Recomputes every extract with `engine` and publishes it under `uri`."""
+    for name, query in extract_queries().items():
+        data = engine.arrow(query).to_pandas()
+        extracts.publish(name, data, uri)
+        print(f"{name}: {len(data)} rows")
+
+
+if __name__ == "__main__":
+    # python engine.py <raw dir> <extract uri>
+    rebuild(DuckDBEngine(sys.argv[1]), sys.argv[2])
@@ -0,0 +1,382 @@
+import contextlib
+import csv
+import hashlib
+import json
+import os
+import sys
+from urllib.parse import quote, unquote
+
+import fsspec
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+import instrument
+import localcache
+import schemas
+
+base_uri = os.environ.get(
+    "DATA_STORIES_EXTRACT_URI", "s3://tuva-public-resources/data-extracts/lds/"
+)
+
+# Read options for every extract the app loads. `columns` lists the columns the
+# pages actually use (None reads them all). Column types are declared in
+# schemas.py.
+EXTRACTS = {
+    "test_results": {},
+    "use_case": {},
+    "cost_summary": {},
+    "year_months": {"columns": ["year_month"]},
+    "summary_stats": {
+        "columns": [
+            "display",
+            "year",
+            "current_period_medical_paid",
+            "prior_period_medical_paid",
+            "current_period_member_months",
+            "prior_period_member_months",
+        ],
+    },
+    "pmpm_by_claim_type": {
+        "columns": ["year_month", "year", "claim_type", "paid_amount_pmpm"],
+    },
+    "pmpm_by_service_category_1": {
+        "columns": ["year_month", "service_category_1", "paid_amount_pmpm"],
+    },
+    "pmpm_by_service_category_1_2": {
+        "columns": [
+            "year_month",
+            "service_category_1",
+            "service_category_2",
+            "paid_amount_sum",
+            "member_month_count",
+            "row_count",
+        ],
+    },
+    "pmpm_by_service_category_1_provider": {
+        "columns": [
+            "year_month",
+            "service_category_1",
+            "provider_name",
+            "paid_amount_sum",
+            "member_month_count",
+            "row_count",
+        ],
+    },
+    "pmpm_by_service_category_1_condition": {
+        "columns": [
+            "year_month",
+            "service_category_1",
+            "condition_family",
+            "paid_amount_sum",
+            "member_month_count",
+            "row_count",
+        ],
+    },
+    "pmpm_by_service_category_1_claim_type": {
+        "columns": [
+            "year_month",
+            "service_category_1",
+            "claim_type",
+            "paid_amount_sum",
+            "member_month_count",
+            "row_count",
+        ],
+    },
+    "pmpm_data": {},
+    "gender_data": {},
+    "race_data": {},
+    "age_data": {},
+    "pmpm_by_chronic_condition": {
+        "columns": [
+            "year_month",
+            "condition_family",
+            "medical_paid_amount_sum",
+            "member_month_count",
+        ],
+    },
+    "condition_data": {
+        "columns": ["diagnosis_year_month", "condition", "condition_cases"],
+    },
+}
+
+# Extracts that are also published as hive-style partitioned datasets under
+# `<uri><name>/<key>=<value>/.../part-0.parquet`. The provider drilldown only
+# opens the slice it needs, and the period partitions let refresh.py pick up a
+# new month without reloading whole extracts. Keys are listed outermost first.
+PARTITIONS = {
+    "year_months": ["year_month"],
+    "summary_stats": ["display"],
+    "pmpm_by_claim_type": ["year_month"],
+    "pmpm_by_service_category_1": ["year_month"],
+    "pmpm_by_service_category_1_2": ["year_month"],
+    "pmpm_by_service_category_1_provider": ["service_category_1", "year_month"],
+    "pmpm_by_service_category_1_condition": ["year_month"],
+    "pmpm_by_service_category_1_claim_type": ["year_month"],
+    "pmpm_data": ["year_month"],
+    "pmpm_by_chronic_condition": ["year_month"],
+    "condition_data": ["diagnosis_year_month"],
+}
+
+
+# CSV copies of an extract in the order they are looked for, with the codec
+# pandas decompresses them with. Compressed copies are decompressed as they
+# stream into the parser, a block at a time.
+CSV_COPIES = [(".csv.zst", "zstd"), (".csv.gz", "gzip"), (".csv", None)]
+
+
+def storage_options(uri):
+    # The public extract bucket is read anonymously, local paths take no options
+    return {"anon": True} if uri.startswith("s3://") else None
+
+
+def _fetched(fs, paths):
+    # Sizes cost a HEAD request each on S3, they are only looked up while
+    # instrumenting. The disk cache records its own downloads.
+    if instrument.active() and not localcache.enabled:
+        instrument.fetched(sum(fs.size(path) for path in paths))
+
+
+def fetched_uri(uri):
+    if instrument.active():
+        fs, path = fsspec.core.url_to_fs(uri, **(storage_options(uri) or {}))
+        _fetched(fs, [path])
+
+
+@contextlib.contextmanager
+def source(uri):
+    """(what to read, storage options) for the object at `uri`: an open local
+    copy when the disk cache is on (DATA_STORIES_DISK_CACHE, see
+    localcache.py), otherwise `uri` itself."""
+    if not localcache.enabled:
+        yield uri, storage_options(uri)
+        return
+    fs, path = fsspec.core.url_to_fs(uri, **(storage_options(uri) or {}))
+    with localcache.open_copy(fs, path) as fp:
+        yield fp, None
+
+
+def local_copy(uri):
+    """Like source(), as a path for readers that open it themselves (dask)."""
+    if not localcache.enabled:
+        return uri, storage_options(uri)
+    fs, path = fsspec.core.url_to_fs(uri, **(storage_options(uri) or {}))
+    return localcache.fetch(fs, path), None
+
+
+def _read_part(fs, path, columns):
+    if not localcache.enabled:
+        return pd.read_parquet(path, columns=columns, filesystem=fs)
+    with localcache.open_copy(fs, path) as fp:
+        return pd.read_parquet(fp, columns=columns)
+
+
+def csv_copy(name, uri=None):
+    """(uri, compression) of the CSV copy of an extract, preferring the
+    compressed ones, see CSV_COPIES."""
+    uri = uri or base_uri
+    fs, root = fsspec.core.url_to_fs(uri, **(storage_options(uri) or {}))
+    for suffix, compression in CSV_COPIES:
+        if fs.exists(f"{root.rstrip('/')}/{name}{suffix}"):
+            return uri + name + suffix, compression
+    raise FileNotFoundError(uri + name + ".csv")
+
+
+@contextlib.contextmanager
+def _opened(uri):
+    with source(uri) as (src, storage):
+        if not isinstance(src, str):
+            yield src
+            return
+        with fsspec.open(src, "rb", **(storage or {})) as fp:
+            yield fp
+
+
+def _header(path, compression):
+    # Only the first block is read (and decompressed). The stream is not
+    # reused for parsing, closing it closes the file.
+    with _opened(path) as fp:
+        block = pa.input_stream(fp, compression=compression).read(2**16)
+    return next(csv.reader([block.split(b"\n", 1)[0].decode().rstrip("\r")]))
+
+
+def read_csv(name, uri=None, columns=None):
+    """Parses the CSV copy of an extract into the column types declared in
+    schemas.py, with Arrow's multithreaded reader. Raises
+    schemas.SchemaMismatch when the file's columns are not the declared ones or
+    a value does not parse as its column's type."""
+    uri = uri or base_uri
+    path, compression = csv_copy(name, uri)
+    schema = schemas.SCHEMAS[name]
+    header = _header(path, compression)
+    schemas.check(name, header)
+    with _opened(path) as fp:
+        try:
+            table = pacsv.read_csv(
+                pa.input_stream(fp, compression=compression),
+                read_options=pacsv.ReadOptions(use_threads=True),
+                convert_options=pacsv.ConvertOptions(
+                    column_types=schema,
+                    include_columns=[c for c in header if c in (columns or header)],
+                    strings_can_be_null=True,
+                ),
+            )
+        except pa.ArrowInvalid as exc:
+            raise schemas.SchemaMismatch(f"{path}: {exc}") from exc
+    fetched_uri(path)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def read(name, uri=None):
+    """Reads an extract from `<uri><name>.parquet`, falling back to the CSV copy
+    (`.csv.zst`, `.csv.gz` or `.csv`) when no parquet file has been published
+    yet."""
+    uri = uri or base_uri
+    columns = EXTRACTS[name].get("columns")
+    with instrument.span("read", name):
+        try:
+            with source(uri + name + ".parquet") as (src, storage):
+                data = pd.read_parquet(src, columns=columns, storage_options=storage)
+            fetched_uri(uri + name + ".parquet")
+        except FileNotFoundError:
+            data = read_csv(name, uri, columns)
+    return data
+
+
+def partition_dir(name, values):
+    return "/".join(
+        f"{key}={quote(str(values[key]), safe='') if key in values else '*'}"
+        for key in PARTITIONS[name]
+    )
+
+
+def parse_partition_dir(path):
+    """`a=x/b=y` -> {"a": "x", "b": "y"}"""
+    return dict(
+        (key, unquote(value))
+        for key, value in (part.split("=", 1) for part in path.strip("/").split("/"))
+    )
+
+
+def read_partitions(name, filters, uri=None):
+    """Reads only the partitions of a partitioned extract matching `filters`, a
+    dict of partition key to value. Keys left out match every partition."""
+    uri = uri or base_uri
+    fs, root = fsspec.core.url_to_fs(uri + name, **(storage_options(uri) or {}))
+    if not fs.exists(root):
+        raise FileNotFoundError(uri + name)
+    columns = EXTRACTS[name].get("columns")
+    paths = sorted(fs.glob(f"{root}/{partition_dir(name, filters)}/*.parquet"))
+    if not paths:
+        return pd.DataFrame(columns=columns)
+    with instrument.span("read", name):
+        data = pd.concat(
+            [_read_part(fs, path, columns) for path in paths],
+            ignore_index=True,
+        )
+        _fetched(fs, paths)
+    return data
+
+
+def read_partition_dirs(name, dirs, uri=None):
+    """Reads the given partition directories (as listed in the manifest)."""
+    uri = uri or base_uri
+    fs, root = fsspec.core.url_to_fs(uri + name, **(storage_options(uri) or {}))
+    columns = EXTRACTS[name].get("columns")
+    paths = [path for d in dirs for path in sorted(fs.glob(f"{root}/{d}/*.parquet"))]
+    with instrument.span("read", name):
+        frames = [_read_part(fs, path, columns) for path in paths]
+        _fetched(fs, paths)
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+def checksum(data):
+    return hashlib.sha256(
+        pd.util.hash_pandas_object(data, index=False).values.tobytes()
+    ).hexdigest()
+
+
+def write_partitions(name, data, uri=None, replace=True):
+    """Writes one parquet file per partition of `data` and returns their
+    checksums by partition directory. With `replace`, partitions missing from
+    `data` are removed, otherwise they are left as they are."""
+    uri = uri or base_uri
+    fs, root = fsspec.core.url_to_fs(uri + name)
+    if replace and fs.exists(root):
+        fs.rm(root, recursive=True)
+    keys = PARTITIONS[name]
+    checksums = {}
+    for values, group in data.groupby(keys, sort=False, observed=True):
+        path = partition_dir(name, dict(zip(keys, values)))
+        fs.makedirs(f"{root}/{path}", exist_ok=True)
+        with fs.open(f"{root}/{path}/part-0.parquet", "wb") as fp:
+            group.to_parquet(fp, index=False)
+        checksums[path] = checksum(group)
+    return checksums
+
+
+def read_manifest(uri=None):
+    """The manifest describing what is published under `uri`:
+    {"version": n, "extracts": {name: {"checksum": ..., "partitions":
+    {partition dir: checksum}}}}"""
+    uri = uri or base_uri
+    try:
+        with fsspec.open(uri + "manifest.json", **(storage_options(uri) or {})) as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return {"version": 0, "extracts": {}}
+
+
+def write_manifest(manifest, uri=None):
+    uri = uri or base_uri
+    with fsspec.open(uri + "manifest.json", "w") as fp:
+        json.dump(manifest, fp, indent=2, sort_keys=True)
+
+
+def publish(name, data, uri=None, partial=False):
+    """Writes `<uri><name>.parquet`, plus the partitioned dataset for extracts
+    listed in PARTITIONS, and records both in the manifest.
+
+    With `partial`, `data` only holds new or restated partitions (say the month
+    that just landed): those partitions are replaced, the others are kept, and
+    the full parquet file is rewritten with the merged rows."""
+    uri = uri or base_uri
+    manifest = read_manifest(uri)
+    entry = manifest["extracts"].get(name, {})
+    full = data
+    if partial:
+        keys = PARTITIONS[name]
+        current = pd.read_parquet(
+            uri + name + ".parquet", storage_options=storage_options(uri)
+        )
+        published = list(data[keys].drop_duplicates().itertuples(index=False))
+        restated = pd.MultiIndex.from_frame(current[keys]).isin(published)
+        full = pd.concat([current.loc[~restated], data], ignore_index=True)
+    full.to_parquet(uri + name + ".parquet", index=False)
+    entry["checksum"] = checksum(full)
+    if name in PARTITIONS:
+        written = write_partitions(name, data, uri, replace=not partial)
+        if partial:
+            written = {**entry.get("partitions", {}), **written}
+        entry["partitions"] = written
+    manifest["extracts"][name] = entry
+    manifest["version"] = manifest.get("version", 0) + 1
+    write_manifest(manifest, uri)
+
+
+def convert(name, uri=None):
+    """Publishes a parquet copy of an extract next to its CSV."""
+    uri = uri or base_uri
+    data = read_csv(name, uri)
+    publish(name, data, uri)
+    return data
+
+
+if __name__ == "__main__":
+    # python extracts.py [base uri] -- publish parquet copies of every extract
+    uri = sys.argv[1] if len(sys.argv) > 1 else base_uri
+    for name in EXTRACTS:
+        rows = len(convert(name, uri))
+        print(f"{name}: {rows} rows")
@@ -1,13 +1,21 @@
 import streamlit as st
 from st_pages import show_pages_from_config, add_page_title
 import altair as alt
+import cache
 import util
 import components as comp
 import data
+import drilldown
 from palette import ORDINAL, PALETTE
-import time
 import pandas as pd
+import instrument
+import profiler
+import rangesum
+import warmup
 
+warmup.start()
+instrument.begin_run()
+profiler.begin_run()
 
 ## --------------------------------- ##
 ## --- Page Setup
@@ -23,14 +31,164 @@ st.image(comp.tuva_logo())
 add_page_title()
 show_pages_from_config()
 
+## --------------------------------- ##
+## Derived Views
+## --------------------------------- ##
+# Memoized per dataset version and year range, so reruns that only change the
+# drilldown do not filter and recompute them again
+
+
+@cache.derived
+def summary_stats_in(selected_range):
+    summary_stats_data = data.summary_stats()
+    return summary_stats_data.loc[summary_stats_data["year"].isin(selected_range)]
+
+
+def summary_totals_in(selected_range):
+    # Running totals by year: a range is two lookups, not a filter and a sum
+    return rangesum.index(
+        data.summary_stats,
+        "year",
+        ["current_period_medical_paid", "current_period_member_months"],
+    ).totals(selected_range[0], selected_range[-1])
+
+
+@cache.derived
+def pmpm_claim_type_in(selected_range):
+    pmpm_claim_type_data = data.pmpm_by_claim_type().sort_values(by="year_month")
+    return pmpm_claim_type_data.loc[pmpm_claim_type_data["year"].isin(selected_range)]
+
+
+@cache.derived
+def spend_change_in(selected_range):
+    summary_stats_data = summary_stats_in(selected_range)
+    for ctype in ["medical"]:
+        summary_stats_data[f"current_period_{ctype}_pmpm"] = (
+            summary_stats_data[f"current_period_{ctype}_paid"]
+            .astype(float)
+            .div(
+                summary_stats_data["current_period_member_months"].astype(float),
+                fill_value=0,
+            )
+        )
+        summary_stats_data[f"prior_period_{ctype}_pmpm"] = (
+            summary_stats_data[f"prior_period_{ctype}_paid"]
+            .astype(float)
+            .div(
+                summary_stats_data["prior_period_member_months"].astype(float),
+                fill_value=0,
+            )
+        )
+        summary_stats_data[f"pct_change_{ctype}_pmpm"] = (
+            summary_stats_data[f"current_period_{ctype}_pmpm"]
+            - summary_stats_data[f"prior_period_{ctype}_pmpm"]
+        ).div(summary_stats_data[f"prior_period_{ctype}_pmpm"], fill_value=0)
+
+    return pd.concat(
+        [
+            summary_stats_data.assign(category=lambda x: ctype.title())[
+                [
+                    "display",
+                    "category",
+                    f"prior_period_{ctype}_pmpm",
+                    f"current_period_{ctype}_pmpm",
+                    f"pct_change_{ctype}_pmpm",
+                ]
+            ].rename(
+                columns={
+                    f"current_period_{ctype}_pmpm": "current_period_pmpm",
+                    f"prior_period_{ctype}_pmpm": "prior_period_pmpm",
+                    f"pct_change_{ctype}_pmpm": "pct_change_pmpm",
+                }
+            )
+            for ctype in [
+                "medical",
+            ]
+        ]
+    )
+
+
+@cache.derived
+def service_category_1_in(selected_range):
+    service_1_data = data.pmpm_by_service_category_1()
+    return service_1_data.loc[
+        service_1_data["year_key"].isin([int(x) for x in selected_range])
+    ]
+
+
+## --------------------------------- ##
+## Chart Specs
+## --------------------------------- ##
+# Built from the views above and cached as JSON per dataset version and
+# selection, so reruns with the same selection reuse the payload
+
+
+@cache.spec
+def claim_type_chart_spec(selected_range, animated):
+    return comp.claim_type_line_chart_option(
+        pmpm_claim_type_in(selected_range).round(), animated
+    )
+
+
+@cache.spec
+def spend_change_chart_spec(selected_range):
+    return comp.pop_grouped_bar_option(spend_change_in(selected_range))
+
+
+@cache.spec
+def service_1_chart_spec(selected_range):
+    service_1_data = service_category_1_in(selected_range)
+    cat_to_color = dict(
+        zip(sorted(service_1_data["service_category_1"].unique()), ORDINAL)
+    )
+
+    highlight = alt.selection_point(
+        on="mouseover",
+        clear="mouseout",
+        fields=["service_category_1"],
+        nearest=True,
+    )
+
+    service_1_chart = (
+        alt.Chart(
+            service_1_data[
+                ["year_month", "service_category_1", "paid_amount_pmpm"]
+            ].round()
+        )
+        .mark_bar()
+        .encode(
+            x="year_month",
+            y=alt.Y("paid_amount_pmpm"),
+            color=alt.Color("service_category_1").scale(
+                domain=list(cat_to_color.keys()), range=list(cat_to_color.values())
+            ),
+            opacity=alt.condition(highlight, alt.value(1.0), alt.value(0.3)),
+            tooltip=["year_month", "service_category_1", "paid_amount_pmpm"],
+        )
+        .add_selection(highlight)
+        .configure_legend(orient="bottom")
+        .properties(height=500)
+    )
+    return service_1_chart.to_dict()
+
+
+@cache.spec
+def drilldown_chart_spec(
+    dimension, service_cat, year_month, title, color, top_n=None, decimals=0
+):
+    # The drilldown cube is rebuilt for each dataset version too
+    breakdown = drilldown.cube().lookup(dimension, service_cat, year_month)
+    return comp.generic_simple_v_bar_option(
+        breakdown.round(decimals), "paid_amount_pmpm", dimension, title, color, top_n
+    )
+
+
 ## --------------------------------- ##
 ## ---                           --- ##
 ## --------------------------------- ##
 year_month_values = sorted(list(set(data.year_months()["year_month"])))
 
 year_values = sorted(list(set([x[:4] for x in year_month_values])))
-pmpm_claim_type_data = data.pmpm_by_claim_type()
-pmpm_claim_type_data.sort_values(by="year_month", inplace=True)
 
 ## --------------------------------- ##
 ## Header
@@ -77,296 +235,188 @@ st.markdown(
     Let's review your key financial performance indicators.
 """
 )
-summary_stats_data = data.summary_stats()
-summary_stats_data = summary_stats_data.loc[
-    summary_stats_data["year"].isin(selected_range)
-]
-pmpm_claim_type_data = pmpm_claim_type_data.loc[
-    pmpm_claim_type_data["year"].isin(selected_range)
-]
-
-if "iteration" not in st.session_state:
-    st.session_state["iteration"] = 0
-
-col1, col2 = st.columns([1, 3])
-with col1:
-    comp.financial_bans(summary_stats_data, direction="vertical")
-with col2:
-    animate = False
-    month_list = sorted(list(set(pmpm_claim_type_data["year_month"])))
-    if animate:
-        while st.session_state["iteration"] < len(month_list):
-            comp.claim_type_line_chart(pmpm_claim_type_data, "430px", True)
-            time.sleep(0.05)
-            st.session_state["iteration"] += 1
-
-            if st.session_state["iteration"] < len(month_list) and animate:
-                st.experimental_rerun()
-    else:
-        comp.claim_type_line_chart(pmpm_claim_type_data.round(), "430px", False)
+
+# Each section below is a fragment: a widget inside one reruns only that
+# section. Changing the year range reruns the whole page.
+selected_range = tuple(selected_range)
+
+
+@st.fragment
+@profiler.section("Spend Summary")
+def spend_summary(selected_range):
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        comp.financial_bans(summary_totals_in(selected_range), direction="vertical")
+    with col2:
+        # The animation plays in the browser, one run and one payload
+        animate = False
+        spec = claim_type_chart_spec(selected_range, animate)
+        comp.echarts(spec, "430px", key="chart")
+
+
+spend_summary(selected_range)
 
 
 ## --------------------------------- ##
 ## Spend Change
 ## --------------------------------- ##
-st.markdown(
-    f"""
-     ### Spend Change over Time
+@st.fragment
+@profiler.section("Spend Change")
+def spend_change(selected_range):
+    st.markdown(
+        f"""
+         ### Spend Change over Time
 
-     View the following chart to understand changes in medical
-     spend over several years.
-"""
-)
-for ctype in ["medical"]:
-    summary_stats_data[f"current_period_{ctype}_pmpm"] = (
-        summary_stats_data[f"current_period_{ctype}_paid"]
-        .astype(float)
-        .div(
-            summary_stats_data["current_period_member_months"].astype(float),
-            fill_value=0,
-        )
-    )
-    summary_stats_data[f"prior_period_{ctype}_pmpm"] = (
-        summary_stats_data[f"prior_period_{ctype}_paid"]
-        .astype(float)
-        .div(
-            summary_stats_data["prior_period_member_months"].astype(float), fill_value=0
-        )
+         View the following chart to understand changes in medical
+         spend over several years.
+    """
     )
-    summary_stats_data[f"pct_change_{ctype}_pmpm"] = (
-        summary_stats_data[f"current_period_{ctype}_pmpm"]
-        - summary_stats_data[f"prior_period_{ctype}_pmpm"]
-    ).div(summary_stats_data[f"prior_period_{ctype}_pmpm"], fill_value=0)
-
-
-# CSS to inject contained in a string
-hide_table_row_index = """
-            <style>
-            thead tr th:first-child {display:none}
-            tbody th {display:none}
-            </style>
-            """
 
-# Inject CSS with Markdown
-st.markdown(hide_table_row_index, unsafe_allow_html=True)
-test = pd.concat(
-    [
-        summary_stats_data.assign(category=lambda x: ctype.title())[
-            [
-                "display",
-                "category",
-                f"prior_period_{ctype}_pmpm",
-                f"current_period_{ctype}_pmpm",
-                f"pct_change_{ctype}_pmpm",
-            ]
-        ].rename(
-            columns={
-                f"current_period_{ctype}_pmpm": "current_period_pmpm",
-                f"prior_period_{ctype}_pmpm": "prior_period_pmpm",
-                f"pct_change_{ctype}_pmpm": "pct_change_pmpm",
-            }
-        )
-        for ctype in [
-            "medical",
-        ]
-    ]
-)
+    # CSS to inject contained in a string
+    hide_table_row_index = """
+                <style>
+                thead tr th:first-child {display:none}
+                tbody th {display:none}
+                </style>
+                """
 
-tab1, tab2 = st.tabs(["Chart", "Data"])
-with tab1:
-    comp.pop_grouped_bar(test)
-with tab2:
-    st.table(util.format_df(test.sort_values("category")))
+    # Inject CSS with Markdown
+    st.markdown(hide_table_row_index, unsafe_allow_html=True)
+    test = spend_change_in(selected_range)
 
-## --------------------------------- ##
-## Service Category 1
-## --------------------------------- ##
-st.markdown("### Service Category")
-st.markdown(
-    """
-    Analyzing medical claims by service category allows healthcare insurers
-    to identify patterns, trends, and cost drivers in the service type being
-    performed for the patient.
-"""
-)
-service_1_data = data.pmpm_by_service_category_1()
-service_1_data = service_1_data.loc[
-    service_1_data["year_month"].str[:4].isin(selected_range)
-]
-cat_to_color = dict(zip(sorted(service_1_data["service_category_1"].unique()), ORDINAL))
-
-highlight = alt.selection_point(
-    on="mouseover",
-    clear="mouseout",
-    fields=["service_category_1"],
-    nearest=True,
-)
+    tab1, tab2 = st.tabs(["Chart", "Data"])
+    with tab1:
+        comp.echarts(spend_change_chart_spec(selected_range))
+    with tab2:
+        st.table(util.format_df(test.sort_values("category")))
 
-service_1_chart = (
-    alt.Chart(service_1_data.round())
-    .mark_bar()
-    .encode(
-        x="year_month",
-        y=alt.Y("paid_amount_pmpm"),
-        color=alt.Color("service_category_1").scale(
-            domain=list(cat_to_color.keys()), range=list(cat_to_color.values())
-        ),
-        opacity=alt.condition(highlight, alt.value(1.0), alt.value(0.3)),
-        tooltip=["year_month", "service_category_1", "paid_amount_pmpm"],
-    )
-    .add_selection(highlight)
-    .configure_legend(orient="bottom")
-    .properties(height=500)
-)
 
-st.altair_chart(service_1_chart, use_container_width=True)
+spend_change(selected_range)
 
 
 ## --------------------------------- ##
-## Drilldown from Service Category 1
+## Service Category 1
 ## --------------------------------- ##
-
-service_cat_options = service_1_data["service_category_1"].drop_duplicates().tolist()
-col1, col2, col3 = st.columns(3)
-with col1:
+@st.fragment
+@profiler.section("Service Category")
+def service_category(selected_range):
+    st.markdown("### Service Category")
     st.markdown(
         """
-    Use the following dropdown to get more detail on the service category that interested you.
+        Analyzing medical claims by service category allows healthcare insurers
+        to identify patterns, trends, and cost drivers in the service type being
+        performed for the patient.
     """
     )
-with col2:
-    selected_service_cat = st.selectbox(
-        label="Select a Service Category",
-        options=service_cat_options,
-        label_visibility="collapsed",
-    )
-with col3:
-    selected_year_month = st.selectbox(
-        label="Select a Year Month",
-        options=["All Time"] + year_month_values,
-        label_visibility="collapsed",
+    service_1_data = service_category_1_in(selected_range)
+    comp.vega_lite_chart(service_1_chart_spec(selected_range))
+
+    service_cat_options = (
+        service_1_data["service_category_1"].drop_duplicates().tolist()
     )
+    service_category_drilldown(service_cat_options)
 
-# Fetch and filter data based on selections above
-service_2_data = data.pmpm_by_service_category_1_2()
-service_2_data = (
-    service_2_data.loc[
-        (
-            (service_2_data["year_month"] == selected_year_month)
-            | (selected_year_month == "All Time")
-        )
-        & service_2_data["service_category_1"].isin([selected_service_cat])
-    ]
-    .drop("service_category_1", axis=1)
-    .reset_index(drop=True)
-)
 
-condition_data = data.pmpm_by_service_category_1_condition()
-condition_data = (
-    condition_data.loc[
-        (
-            (condition_data["year_month"] == selected_year_month)
-            | (selected_year_month == "All Time")
+## --------------------------------- ##
+## Drilldown from Service Category 1
+## --------------------------------- ##
+@st.fragment
+@profiler.section("Drilldown")
+def service_category_drilldown(service_cat_options):
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.markdown(
+            """
+        Use the following dropdown to get more detail on the service category that interested you.
+        """
+        )
+    with col2:
+        selected_service_cat = st.selectbox(
+            label="Select a Service Category",
+            options=service_cat_options,
+            label_visibility="collapsed",
+        )
+    with col3:
+        selected_year_month = st.selectbox(
+            label="Select a Year Month",
+            options=["All Time"] + year_month_values,
+            label_visibility="collapsed",
         )
-        & condition_data["service_category_1"].isin([selected_service_cat])
-    ]
-    .drop("service_category_1", axis=1)
-    .reset_index(drop=True)
-)
-
-provider_data = data.pmpm_by_service_category_1_provider(
-    selected_service_cat, selected_year_month
-)
 
-claim_type_data = data.pmpm_by_service_category_1_claim_type()
-claim_type_data = (
-    claim_type_data.loc[
-        (
-            (claim_type_data["year_month"] == selected_year_month)
-            | (selected_year_month == "All Time")
+    # Breakdowns for the selections above, precomputed for every selection
+    selection = (selected_service_cat, selected_year_month)
+    top_col1, top_col2 = st.columns(2)
+    bot_col1, bot_col2 = st.columns(2)
+    with top_col1:
+        title = "PMPM by Service Category 2"
+        spec = drilldown_chart_spec(
+            "service_category_2", *selection, title, PALETTE["4-cerulean"]
         )
-        & claim_type_data["service_category_1"].isin([selected_service_cat])
-    ]
-    .drop("service_category_1", axis=1)
-    .reset_index(drop=True)
-)
+        comp.echarts(spec, height="350px")
+    with top_col2:
+        title = "Top 5 Conditions by PMPM"
+        spec = drilldown_chart_spec(
+            "condition_family", *selection, title, PALETTE["melon"], top_n=5
+        )
+        comp.echarts(spec, height="350px")
+    with bot_col1:
+        title = "Top 10 Providers by PMPM"
+        spec = drilldown_chart_spec(
+            "provider_name",
+            *selection,
+            title,
+            PALETTE["french-grey"],
+            top_n=10,
+            decimals=5,
+        )
+        comp.echarts(spec, height="350px")
+    with bot_col2:
+        title = "PMPM by Claim Type"
+        spec = drilldown_chart_spec(
+            "claim_type", *selection, title, PALETTE["2-light-sky-blue"]
+        )
+        comp.echarts(spec, height="350px")
 
-# Re-group to get PMPM
-claim_type_data = util.group_for_pmpm(claim_type_data, "claim_type")
-condition_data = util.group_for_pmpm(condition_data, "condition_family")
-service_2_data = util.group_for_pmpm(service_2_data, "service_category_2")
-
-top_col1, top_col2 = st.columns(2)
-bot_col1, bot_col2 = st.columns(2)
-with top_col1:
-    title = "PMPM by Service Category 2"
-    comp.generic_simple_v_bar(
-        df=service_2_data.round(),
-        x="paid_amount_pmpm",
-        y="service_category_2",
-        title=title,
-        color=PALETTE["4-cerulean"],
-        height="350px",
-    )
-with top_col2:
-    title = "Top 5 Conditions by PMPM"
-    comp.generic_simple_v_bar(
-        df=condition_data.round(),
-        x="paid_amount_pmpm",
-        y="condition_family",
-        title=title,
-        top_n=5,
-        color=PALETTE["melon"],
-        height="350px",
-    )
-with bot_col1:
-    title = "Top 10 Providers by PMPM"
-    comp.generic_simple_v_bar(
-        df=provider_data.round(5),
-        x="paid_amount_pmpm",
-        y="provider_name",
-        title=title,
-        top_n=10,
-        color=PALETTE["french-grey"],
-        height="350px",
-    )
-with bot_col2:
-    title = "PMPM by Claim Type"
-    comp.generic_simple_v_bar(
-        df=claim_type_data.round(),
-        x="paid_amount_pmpm",
-        y="claim_type",
-        title=title,
-        color=PALETTE["2-light-sky-blue"],
-        height="350px",
-    )
+
+service_category(selected_range)
 
 
 ## --------------------------------- ##
 ## Cost Variables
 ## --------------------------------- ##
-st.markdown("### Quality Summary")
-"""
-Here we used the Tuva data profiling data mart to analyze the data quality of the LDS data.
-This data mart looks for approximately 250 different types of data quality issues that can occur
-in claims data.
-"""
-use_case_data = data.use_case()
-st.dataframe(use_case_data, use_container_width=True)
+@st.fragment
+@profiler.section("Quality Summary")
+def quality_summary():
+    st.markdown("### Quality Summary")
+    st.markdown(
+        """
+    Here we used the Tuva data profiling data mart to analyze the data quality of the LDS data.
+    This data mart looks for approximately 250 different types of data quality issues that can occur
+    in claims data.
+    """
+    )
+    use_case_data = data.use_case()
+    st.dataframe(use_case_data, use_container_width=True)
 
-st.markdown(
+    st.markdown(
+        """
+    You can also review specific test results in the following table that lists
+    all the checks that failed.
     """
-You can also review specific test results in the following table that lists
-all the checks that failed.
-"""
-)
-test_result_data = data.test_results()
-st.dataframe(test_result_data, use_container_width=True)
-
-# st.markdown(
-#     """
-# Then check out the distribution of cost for the spend variables.
-# """
-# )
-# cost_summary_data = data.cost_summary()
-# st.dataframe(cost_summary_data, use_container_width=True)
+    )
+    test_result_data = data.test_results()
+    st.dataframe(test_result_data, use_container_width=True)
+
+    # st.markdown(
+    #     """
+    # Then check out the distribution of cost for the spend variables.
+    # """
+    # )
+    # cost_summary_data = data.cost_summary()
+    # st.dataframe(cost_summary_data, use_container_width=True)
+
+
+quality_summary()
+
+instrument.sidebar()
+profiler.report()
@@ -0,0 +1,188 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from contextvars import ContextVar
+from functools import wraps
+
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+# Set DATA_STORIES_INSTRUMENT=1 to record every loader and renderer call, in
+# every session, as structured log lines. A single session can turn recording
+# on for itself with ?diagnostics=1, which also shows the sidebar panel, see
+# begin_run(). Otherwise the wrappers only check two flags and call through.
+enabled = os.environ.get("DATA_STORIES_INSTRUMENT") == "1"
+
+# The latest records of the process, newest last
+records = deque(maxlen=int(os.environ.get("DATA_STORIES_INSTRUMENT_RECORDS", 2000)))
+
+# Session ids with ?diagnostics=1
+_sessions = set()
+
+# The innermost open span of the running thread
+_current = ContextVar("span", default=None)
+
+_page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_mb():
+    """Resident memory of the server process in MB, None off Linux."""
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * _page_size / 2**20
+    except OSError:
+        return None
+
+
+def _session_id():
+    # Loaders also run outside Streamlit (warm-up, benchmarks, refresh.py)
+    if "streamlit" not in sys.modules:
+        return None
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else None
+
+
+def active():
+    return enabled or (bool(_sessions) and _session_id() in _sessions)
+
+
+class Span:
+    """Times a block and emits a record of it on exit. Cache lookups and
+    fetched bytes inside the block are attributed to the innermost span."""
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.rows = None
+        self.bytes = None
+        self.cache = None
+
+    def __enter__(self):
+        self.parent = _current.get()
+        self._token = _current.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._start
+        _current.reset(self._token)
+        emit(
+            {
+                "kind": self.kind,
+                "name": self.name,
+                "parent": self.parent.name if self.parent else None,
+                "seconds": round(seconds, 6),
+                "rows": self.rows,
+                "bytes": self.bytes,
+                "cache": self.cache,
+                "rss_mb": rss_mb(),
+                "error": exc_type.__name__ if exc_type else None,
+                "session": _session_id(),
+                "thread": threading.current_thread().name,
+                "time": time.time(),
+            }
+        )
+
+
+def emit(record):
+    records.append(record)
+    log.info(json.dumps(record))
+
+
+def span(kind, name):
+    """Context manager recording the block as a `kind` step of `name`, or
+    doing nothing while recording is off."""
+    return Span(kind, name) if active() else nullcontext()
+
+
+def cache_lookup(hit):
+    """Called by the shared cache on every lookup."""
+    current = _current.get()
+    if current is not None and current.cache is None:
+        current.cache = "hit" if hit else "miss"
+
+
+def fetched(nbytes):
+    """Adds bytes read from the extract store to the open spans."""
+    current = _current.get()
+    while current is not None:
+        current.bytes = (current.bytes or 0) + nbytes
+        current = current.parent
+
+
+def _rows(result, args, kwargs):
+    for value in (result, *args, *kwargs.values()):
+        if isinstance(value, pd.DataFrame):
+            return len(value)
+    return None
+
+
+def instrumented(kind):
+    """Decorator recording each call as a `kind` span, with the row count of
+    the frame returned or, failing that, the first frame passed in."""
+
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not active():
+                return fn(*args, **kwargs)
+            with Span(kind, fn.__name__) as current:
+                result = fn(*args, **kwargs)
+                current.rows = _rows(result, args, kwargs)
+            return result
+
+        return wrapper
+
+    return decorate
+
+
+# Outermost on the data.py loaders, so cache hits are recorded too
+loader = instrumented("load")
+renderer = instrumented("render")
+
+
+def begin_run():
+    """Pages call this first: turns recording on for the session when the URL
+    has ?diagnostics=1, and off again when it does not."""
+    import streamlit as st
+
+    session = _session_id()
+    if st.query_params.get("diagnostics") == "1":
+        _sessions.add(session)
+    else:
+        _sessions.discard(session)
+
+
+def sidebar():
+    """Pages call this last: the diagnostics panel, for sessions that asked
+    for it. A fragment rerun records its calls but does not redraw the panel,
+    they show after the next full rerun."""
+    session = _session_id()
+    if session not in _sessions:
+        return
+    import streamlit as st
+
+    import cache
+
+    calls = pd.DataFrame(
+        [record for record in list(records) if record["session"] == session],
+        columns=["kind", "name", "parent", "seconds", "rows", "bytes", "cache"],
+    )
+    with st.sidebar.expander("Diagnostics", expanded=True):
+        st.caption(f"Resident memory: {rss_mb() or 0:,.0f} MB")
+        st.dataframe(calls.iloc[::-1], hide_index=True, use_container_width=True)
+        totals = calls.groupby(["kind", "name"], as_index=False)["seconds"].sum()
+        st.dataframe(
+            totals.sort_values("seconds", ascending=False),
+            hide_index=True,
+            use_container_width=True,
+        )
+        st.json({"frames": cache.frames.stats(), "specs": cache.specs.stats()})
@@ -0,0 +1,161 @@
+import fcntl
+import hashlib
+import os
+import threading
+import uuid
+
+import instrument
+
+# Directory of the on-disk copy of fetched extract objects, shared by every
+# server process on the host (unset: objects are read from the store directly)
+root = os.environ.get("DATA_STORIES_DISK_CACHE")
+enabled = bool(root)
+max_bytes = int(os.environ.get("DATA_STORIES_DISK_CACHE_BYTES", 20 * 2**30))
+
+_BLOCK = 2**20
+
+# Entries whose checksum this process already checked
+_verified = set()
+_lock = threading.Lock()
+
+
+def key(uri, info):
+    """Entries are keyed by the object's URI and version: its ETag where the
+    store has one (S3), else its modification time, plus its size, so a
+    republished extract is fetched again."""
+    version = info.get("ETag") or info.get("mtime") or info.get("LastModified")
+    text = f"{uri}\0{version}\0{info.get('size')}"
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _paths(entry):
+    path = os.path.join(root, entry[:2], entry)
+    return path, path + ".sha256"
+
+
+def _digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as fp:
+        while block := fp.read(_BLOCK):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _tmp(path):
+    return f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+
+
+def _check(entry):
+    """Whether a complete, intact copy of `entry` is on disk. A copy failing
+    its checksum is removed."""
+    path, sidecar = _paths(entry)
+    try:
+        with open(sidecar) as fp:
+            expected = fp.read().strip()
+        if entry in _verified:
+            return os.path.exists(path)
+        if _digest(path) == expected:
+            with _lock:
+                _verified.add(entry)
+            return True
+    except FileNotFoundError:
+        return False
+    for stale in (path, sidecar):
+        try:
+            os.remove(stale)
+        except FileNotFoundError:
+            pass
+    return False
+
+
+def _download(fs, remote, entry):
+    path, sidecar = _paths(entry)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp, sha, size = _tmp(path), hashlib.sha256(), 0
+    try:
+        with fs.open(remote, "rb") as src, open(tmp, "wb") as dst:
+            while block := src.read(_BLOCK):
+                sha.update(block)
+                dst.write(block)
+                size += len(block)
+            dst.flush()
+            os.fsync(dst.fileno())
+        # Renames are atomic, readers see the whole file or none of it
+        os.replace(tmp, path)
+        tmp = _tmp(sidecar)
+        with open(tmp, "w") as fp:
+            fp.write(sha.hexdigest())
+        os.replace(tmp, sidecar)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    with _lock:
+        _verified.add(entry)
+    instrument.fetched(size)
+    evict(keep=entry)
+
+
+def entries():
+    """[(last used, bytes, entry)] of every complete copy on disk."""
+    found = []
+    for shard in os.scandir(root) if os.path.isdir(root) else []:
+        if not shard.is_dir():
+            continue
+        for item in os.scandir(shard.path):
+            if item.name.endswith((".sha256", ".tmp")):
+                continue
+            try:
+                stat = item.stat()
+            except FileNotFoundError:
+                continue
+            found.append((stat.st_mtime, stat.st_size, item.name))
+    return found
+
+
+def evict(keep=None):
+    """Removes the least recently used copies until the cache fits in
+    `max_bytes`. Processes evict one at a time under a lock file, a reader
+    holding a removed copy open keeps reading it."""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            found = sorted(entries())
+            total = sum(size for _, size, _ in found)
+            for _, size, entry in found:
+                if total <= max_bytes:
+                    break
+                if entry == keep:
+                    continue
+                for path in _paths(entry):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                with _lock:
+                    _verified.discard(entry)
+                total -= size
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def fetch(fs, remote):
+    """Local path of a verified copy of `remote` on `fs`, downloaded on a
+    miss. Raises FileNotFoundError when the object does not exist."""
+    entry = key(fs.unstrip_protocol(remote), fs.info(remote))
+    if not _check(entry):
+        _download(fs, remote, entry)
+    path = _paths(entry)[0]
+    # The modification time orders entries for eviction
+    os.utime(path)
+    return path
+
+
+def open_copy(fs, remote):
+    """Opens the local copy of `remote` for reading. The copy may be evicted
+    by another process between fetching and opening it, then it is fetched
+    again."""
+    try:
+        return open(fetch(fs, remote), "rb")
+    except FileNotFoundError:
+        return open(fetch(fs, remote), "rb")
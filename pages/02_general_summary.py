@@ -2,10 +2,17 @@ import streamlit as st
 import plost
 import components as comp
 import data
+import downsample
+import instrument
+import profiler
+import rangesum
+import warmup
 
+warmup.start()
+instrument.begin_run()
+profiler.begin_run()
 comp.add_logo()
 
-cost_data = data.summary_stats()
 pmpm_data = data.pmpm_data()
 demo_gender = data.gender_data()
 demo_race = data.race_data()
@@ -17,9 +24,11 @@ start_year, end_year = st.select_slider(
     options=sorted(list(set(pmpm_data["year"]))),
     value=(pmpm_data["year"].min(), pmpm_data["year"].max()),
 )
-filtered_cost_data = cost_data.loc[
-    (cost_data["year"] >= str(start_year)) & (cost_data["year"] <= str(end_year)), :
-]
+cost_totals = rangesum.index(
+    data.summary_stats,
+    "year",
+    ["current_period_medical_paid", "current_period_member_months"],
+).totals(str(start_year), str(end_year))
 filtered_pmpm_data = pmpm_data.loc[
     (pmpm_data["year"] >= start_year) & (pmpm_data["year"] <= end_year), :
 ]
@@ -31,7 +40,7 @@ st.markdown(
 graph for other important financial metrics"""
 )
 st.sidebar.markdown("# Claims Summary")
-comp.financial_bans(filtered_cost_data)
+comp.financial_bans(cost_totals)
 
 st.divider()
 y_axis = st.selectbox(
@@ -39,7 +48,11 @@ y_axis = st.selectbox(
 )
 
 if y_axis:
-    st.line_chart(filtered_pmpm_data, x="year_month", y=y_axis)
+    st.line_chart(
+        downsample.frame(filtered_pmpm_data, "year_month", y_axis),
+        x="year_month",
+        y=y_axis,
+    )
 
 # Patient Demographic Section
 st.divider()
@@ -83,3 +96,6 @@ plost.bar_chart(
     title="Counts by Race",
     height=400,
 )
+
+instrument.sidebar()
+profiler.report()
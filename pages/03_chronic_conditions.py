@@ -2,7 +2,15 @@ import streamlit as st
 import plost
 import components as comp
 import data
+import downsample
+import instrument
+import profiler
+import rangesum
+import warmup
 
+warmup.start()
+instrument.begin_run()
+profiler.begin_run()
 comp.add_logo()
 
 ## --------------------------------- ##
@@ -22,15 +30,16 @@ selected_range = comp.year_slider(year_values)
 
 
 chronic_condition_counts = data.condition_data()
-chronic_condition_data = data.pmpm_by_chronic_condition()
-chronic_condition_data = chronic_condition_data.loc[
-    chronic_condition_data["year_month"].str[:4].isin(selected_range)
-]
+selected_years = [int(x) for x in selected_range]
+# Running totals by year, the slider range is summed without scanning rows
 chronic_condition_data = (
-    chronic_condition_data.groupby("condition_family", as_index=False)[
-        ["medical_paid_amount_sum", "member_month_count"]
-    ]
-    .sum()
+    rangesum.index(
+        data.pmpm_by_chronic_condition,
+        "year_key",
+        ["medical_paid_amount_sum", "member_month_count"],
+        group="condition_family",
+    )
+    .range(selected_years[0], selected_years[-1])
     .assign(
         medical_paid_amount_pmpm=lambda x: x["medical_paid_amount_sum"]
         / x["member_month_count"]
@@ -50,19 +59,36 @@ st.markdown(
     """The chart below shows trends in new cases of the top five chronic conditions during the
 claims period selected."""
 )
-msk = chronic_condition_counts["diagnosis_year"].isin(selected_range)
-filtered_cond_data = chronic_condition_counts.loc[msk, :]
 top5_conditions = (
-    filtered_cond_data.groupby("condition")["condition_cases"].sum().nlargest(5)
+    rangesum.index(
+        data.condition_data,
+        "diagnosis_year_key",
+        ["condition_cases"],
+        group="condition",
+    )
+    .range(selected_years[0], selected_years[-1])
+    .nlargest(5, "condition_cases")
 )
-msk = filtered_cond_data["condition"].isin(top5_conditions.index)
-top5_filtered_cond = filtered_cond_data.loc[msk, :]
+# Only the rows of the top five are filtered, for the chart
+msk = chronic_condition_counts["diagnosis_year_key"].between(
+    selected_years[0], selected_years[-1]
+)
+msk &= chronic_condition_counts["condition"].isin(top5_conditions["condition"])
+# Only the charted columns, the year key stays out of the chart payload
+top5_filtered_cond = chronic_condition_counts.loc[
+    msk, ["diagnosis_year_month", "condition", "condition_cases"]
+]
 
 plost.line_chart(
-    data=top5_filtered_cond,
+    data=downsample.frame(
+        top5_filtered_cond, "diagnosis_year_month", "condition_cases", by="condition"
+    ),
     x="diagnosis_year_month",
     y="condition_cases",
     color="condition",
     pan_zoom=None,
     height=400,
 )
+
+instrument.sidebar()
+profiler.report()
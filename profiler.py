@@ -0,0 +1,166 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Open a page with ?profile=1 to sample one run of it and get the report in the
+# sidebar. Only the thread running that session's script is sampled, other
+# sessions run as usual. Set DATA_STORIES_PROFILE_KEY to require
+# ?profile=<key> instead.
+key = os.environ.get("DATA_STORIES_PROFILE_KEY")
+interval = float(os.environ.get("DATA_STORIES_PROFILE_INTERVAL", 0.005))
+
+# A run that never reaches report() (st.stop, an exception) stops being sampled
+# after this long
+MAX_SECONDS = 300
+
+# Samples taken outside any section
+PAGE = "(page)"
+
+# Profiles being recorded, by the ident of the script thread they sample
+_profiles = {}
+
+
+class Profile:
+    """Samples the stack of `thread` every `interval` seconds from a
+    background thread, keyed by the innermost section open at the time."""
+
+    def __init__(self, thread, root, interval=interval):
+        self.thread = thread
+        # Frames above the outermost one in this file (Streamlit's script
+        # runner) are left out of the stacks
+        self.root = root
+        self.interval = interval
+        self.sections = []
+        self.samples = Counter()
+        self.seconds = 0.0
+        self._start = time.perf_counter()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+        self.seconds = time.perf_counter() - self._start
+
+    def _run(self):
+        deadline = time.monotonic() + MAX_SECONDS
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread.ident)
+            if frame is None:
+                break
+            stack, top = [], None
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                if code.co_filename == self.root:
+                    top = len(stack)
+                frame = frame.f_back
+            stack = stack[:top]
+            # section() pushes and pops on the profiled thread, read one copy
+            sections = list(self.sections)
+            section = sections[-1] if sections else PAGE
+            self.samples[(section, *reversed(stack))] += 1
+
+    def _seconds(self, counts):
+        total = sum(self.samples.values()) or 1
+        return [count / total * self.seconds for count in counts]
+
+    def sections_report(self):
+        """Wall seconds and share of the run spent in each section."""
+        by_section = Counter()
+        for stack, count in self.samples.items():
+            by_section[stack[0]] += count
+        report = pd.DataFrame(by_section.most_common(), columns=["section", "samples"])
+        report["seconds"] = self._seconds(report["samples"])
+        report["share"] = report["samples"] / (report["samples"].sum() or 1)
+        return report
+
+    def functions_report(self, top=20):
+        """Functions by the time spent in their own code (the sampled frame)."""
+        own = Counter()
+        for stack, count in self.samples.items():
+            if len(stack) > 1:
+                own[stack[-1]] += count
+        report = pd.DataFrame(own.most_common(top), columns=["function", "samples"])
+        report["seconds"] = self._seconds(report["samples"])
+        return report
+
+    def folded(self):
+        """The samples as folded stacks, `section;frame;...;frame count` per
+        line, which flamegraph.pl and speedscope.app draw as a flame graph."""
+        return "".join(
+            f"{';'.join(stack)} {count}\n" for stack, count in self.samples.items()
+        )
+
+
+@contextmanager
+def section(name):
+    """Attributes samples taken inside the block, or the decorated function,
+    to `name`. Free when the running thread is not being profiled."""
+    profile = _profiles.get(threading.get_ident())
+    if profile is None:
+        yield
+        return
+    profile.sections.append(name)
+    try:
+        yield
+    finally:
+        profile.sections.pop()
+
+
+def begin_run():
+    """Pages call this first: starts profiling this run when the URL asks."""
+    import streamlit as st
+
+    value = st.query_params.get("profile")
+    if value is None or value != (key or "1"):
+        return None
+    thread = threading.current_thread()
+    previous = _profiles.pop(thread.ident, None)
+    if previous is not None:
+        previous.stop()
+    root = sys._getframe(1).f_code.co_filename
+    profile = _profiles[thread.ident] = Profile(thread, root).start()
+    return profile
+
+
+def report():
+    """Pages call this last: stops profiling the run and shows the report,
+    with the folded stacks for download."""
+    profile = _profiles.pop(threading.get_ident(), None)
+    if profile is None:
+        return None
+    profile.stop()
+    import streamlit as st
+
+    with st.sidebar.expander("Profile", expanded=True):
+        st.caption(
+            f"{profile.seconds:.2f}s, {sum(profile.samples.values())} samples"
+            f" every {profile.interval * 1e3:.0f}ms"
+        )
+        st.dataframe(
+            profile.sections_report().round(3),
+            hide_index=True,
+            use_container_width=True,
+        )
+        st.dataframe(
+            profile.functions_report().round(3),
+            hide_index=True,
+            use_container_width=True,
+        )
+        st.download_button(
+            "Download flame graph (folded stacks)",
+            profile.folded(),
+            file_name="profile.folded",
+            mime="text/plain",
+        )
+    return profile
@@ -0,0 +1,106 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import cache
+
+
+class PrefixSumIndex:
+    """Per-group running totals of an extract's measures over its sorted
+    periods (years, months, ...). The sum of any contiguous range of periods is
+    the difference of two columns, so a year slider is answered in O(groups)
+    instead of filtering and regrouping every row.
+
+    `range(start, end)` returns what
+    `frame[frame[period].between(start, end)].groupby(group, observed=True)
+    [measures].sum()` would, as a frame with one row per group that has rows
+    in the range."""
+
+    def __init__(self, frame, period, measures, group=None, version=None):
+        self.version = version
+        self.period = period
+        self.group = group
+        self.measures = list(measures)
+        self.dtypes = [frame[m].dtype for m in self.measures]
+        self.periods, period_codes = np.unique(
+            frame[period].to_numpy(), return_inverse=True
+        )
+        if group is None:
+            group_codes = np.zeros(len(frame), dtype="int64")
+            self.groups = None
+            n_groups = 1
+        else:
+            group_codes, self.groups = pd.factorize(frame[group], sort=True)
+            # Rows without a group are left out, as groupby does
+            keep = group_codes >= 0
+            group_codes, period_codes = group_codes[keep], period_codes[keep]
+            frame = frame.loc[keep]
+            n_groups = len(self.groups)
+
+        # One cell per group and period, plus a row count so groups without
+        # rows in a range can be dropped
+        cells = group_codes * len(self.periods) + period_codes
+        shape = (n_groups, len(self.periods))
+        totals = [
+            np.bincount(
+                cells,
+                weights=frame[m].to_numpy(dtype="float64"),
+                minlength=shape[0] * shape[1],
+            ).reshape(shape)
+            for m in self.measures
+        ]
+        totals.append(np.bincount(cells, minlength=shape[0] * shape[1]).reshape(shape))
+        stacked = np.stack(totals, axis=-1)
+        self.cumulative = np.concatenate(
+            [np.zeros((n_groups, 1, stacked.shape[-1])), np.cumsum(stacked, axis=1)],
+            axis=1,
+        )
+
+    @property
+    def nbytes(self):
+        return self.cumulative.nbytes
+
+    def _sums(self, start, end):
+        i = np.searchsorted(self.periods, start, side="left")
+        j = np.searchsorted(self.periods, end, side="right")
+        return self.cumulative[:, max(j, i)] - self.cumulative[:, i]
+
+    def _frame(self, sums):
+        frame = pd.DataFrame(sums[:, :-1], columns=self.measures)
+        for m, dtype in zip(self.measures, self.dtypes):
+            if pd.api.types.is_integer_dtype(dtype):
+                frame[m] = np.rint(frame[m]).astype("int64")
+        return frame
+
+    def range(self, start, end):
+        """Sums of the measures by group over the periods start..end, both
+        included."""
+        sums = self._sums(start, end)
+        present = sums[:, -1] > 0
+        frame = self._frame(sums[present])
+        if self.group is not None:
+            frame.insert(0, self.group, np.asarray(self.groups)[present])
+        return frame
+
+    def totals(self, start, end):
+        """Sums of the measures over every group, as a Series."""
+        return self._frame(self._sums(start, end).sum(axis=0, keepdims=True)).iloc[0]
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def index(loader, period, measures, group=None):
+    """The index over `loader()`'s extract for the current dataset version,
+    built on first use and rebuilt after the shared cache's contents change
+    (see cache.SharedFrameCache.version)."""
+    key = (loader.__name__, period, tuple(measures), group)
+    with _lock:
+        version = cache.frames.version
+        built = _indexes.get(key)
+        if built is None or built.version != version:
+            built = PrefixSumIndex(loader(), period, measures, group, version)
+            _indexes[key] = built
+        return built
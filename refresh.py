@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import cache
+import data
+import extracts
+
+log = logging.getLogger(__name__)
+
+# Columns derived from the previous period with lag(). After a refresh they are
+# recomputed only for the periods that changed and the period right after each
+# changed or removed one. "order" must sort like the query's lag() window:
+# display is year || 'Q' || quarter, which sorts like (year, quarter).
+LAGS = {
+    "summary_stats": {
+        "order": "display",
+        "lags": {
+            "prior_period_medical_paid": "current_period_medical_paid",
+            "prior_period_member_months": "current_period_member_months",
+        },
+        "pct_change": {
+            "pct_change_medical_paid": (
+                "current_period_medical_paid",
+                "prior_period_medical_paid",
+            ),
+            "pct_change_member_months": (
+                "current_period_member_months",
+                "prior_period_member_months",
+            ),
+        },
+    },
+}
+
+# The manifest the cached frames were last brought up to date with
+applied = None
+
+_thread = None
+_lock = threading.Lock()
+
+
+def recompute_lags(name, table, periods):
+    spec = LAGS[name]
+    frame = table.to_pandas()
+    frame = frame.sort_values(spec["order"]).reset_index(drop=True)
+    order = frame[spec["order"]]
+    changed = frame.index[order.isin(periods)]
+    # The row after each period, whether it is still there or was removed
+    following = order.searchsorted(periods, side="right")
+    affected = sorted(set(changed) | {i for i in following if i < len(frame)})
+    if not affected:
+        return cache.to_table(frame)
+    for lag, source in spec["lags"].items():
+        if lag in frame:
+            frame.loc[affected, lag] = frame[source].shift().loc[affected]
+    for pct, (current, prior) in spec["pct_change"].items():
+        if pct in frame:
+            # div0null: 0 when the prior period is missing or zero
+            rows = frame.loc[affected]
+            change = (rows[current] - rows[prior]) / rows[prior]
+            valid = rows[prior].notna() & (rows[prior] != 0)
+            frame.loc[affected, pct] = change.where(valid, 0)
+    return cache.to_table(frame)
+
+
+def merge(name, table, dirs, rows):
+    """Drops the rows of `table` in the partitions `dirs` and appends `rows`,
+    the freshly loaded contents of those partitions."""
+    (key,) = extracts.PARTITIONS[name]
+    periods = [extracts.parse_partition_dir(d)[key] for d in dirs]
+    column = table.column(key)
+    stale = pc.is_in(column, value_set=pa.array(periods, type=column.type))
+    if pc.any(stale).as_py():
+        table = table.filter(pc.invert(stale))
+    if rows is not None and len(rows):
+        table = pa.concat_tables(
+            [table, cache.to_table(rows)], promote_options="permissive"
+        )
+    if name in LAGS:
+        table = recompute_lags(name, table, periods)
+    return table
+
+
+def apply(name, old, new):
+    """Brings the cached copies of one extract from manifest entry `old` to
+    `new`. Returns True when anything changed."""
+    if old.get("checksum") == new.get("checksum"):
+        return False
+    _apply(name, old, new)
+    # _apply's update or invalidation only bumps the version when the extract
+    # is cached. Views, range indexes and the drilldown cube built from a copy
+    # evicted since must be rebuilt too.
+    cache.frames.bump()
+    return True
+
+
+def _apply(name, old, new):
+    old_parts, new_parts = old.get("partitions"), new.get("partitions")
+    if old_parts is None or new_parts is None:
+        # Not partitioned, or not before: reload on next use
+        cache.frames.invalidate(lambda key: key[0] == name)
+        return
+
+    changed = [d for d, digest in new_parts.items() if old_parts.get(d) != digest]
+    removed = [d for d in old_parts if d not in new_parts]
+    log.info("refreshing %s: %d changed, %d removed", name, len(changed), len(removed))
+
+    if name == "pmpm_by_service_category_1_provider":
+        # Cached per (service category, month) selection, keyed (name,
+        # service_cat, year_month, top_n). The whole extract is the
+        # (None, "All Time") selection. Drop what is stale.
+        stale = {
+            tuple(extracts.parse_partition_dir(d).values()) for d in changed + removed
+        }
+        cache.frames.invalidate(
+            lambda key: key[0] == name
+            and (key[2] == "All Time" or (key[1], key[2]) in stale)
+        )
+        return
+
+    loader = getattr(data, name)
+    rows = data.load_partitions(loader, changed) if changed else None
+    cache.frames.update(
+        (name,), lambda table: merge(name, table, changed + removed, rows)
+    )
+
+
+def poll(uri=None):
+    """Reads the manifest and applies whatever changed since the last poll.
+    The first poll only records the manifest the app started from."""
+    global applied
+    manifest = extracts.read_manifest(uri)
+    if applied is None:
+        applied = manifest
+        return []
+    if manifest.get("version") == applied.get("version"):
+        return []
+    refreshed = [
+        name
+        for name, entry in manifest["extracts"].items()
+        if apply(name, applied["extracts"].get(name, {}), entry)
+    ]
+    applied = manifest
+    return refreshed
+
+
+def _run(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            refreshed = poll()
+            if refreshed:
+                log.info("refreshed %s", ", ".join(refreshed))
+        except Exception:
+            log.exception("extract refresh failed")
+
+
+def start(interval):
+    """Records the current manifest, then polls it every `interval` seconds in
+    a background thread, once per process."""
+    global _thread
+    with _lock:
+        if _thread is None:
+            poll()
+            _thread = threading.Thread(
+                target=_run, args=(interval,), name="refresh", daemon=True
+            )
+            _thread.start()
+    return _thread
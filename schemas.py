@@ -0,0 +1,160 @@
+import pyarrow as pa
+
+STRING = pa.string()
+DOUBLE = pa.float64()
+INT = pa.int64()
+
+# Column types of every extract, as the loader queries return them. CSV copies
+# are parsed straight into these types (see extracts.read_csv) and a file that
+# does not match them is an error rather than something to patch up after
+# loading. Periods stay "YYYY-MM" / "YYYY" strings, compact.py derives integer
+# keys from them.
+SCHEMAS = {
+    "test_results": pa.schema(
+        [
+            ("source_table", STRING),
+            ("test_category", STRING),
+            ("test_field", STRING),
+            ("test_name", STRING),
+            ("claim_type", STRING),
+            ("grain", STRING),
+            ("pipeline_test", STRING),
+            ("counts", INT),
+        ]
+    ),
+    "use_case": pa.schema(
+        [
+            ("use_case", STRING),
+            ("test_name", STRING),
+            ("test_category", STRING),
+            ("claim_type", STRING),
+            ("counts", INT),
+        ]
+    ),
+    "cost_summary": pa.schema(
+        [
+            ("claim_type", STRING),
+            ("variable", STRING),
+            ("statistic", STRING),
+            ("value", DOUBLE),
+        ]
+    ),
+    "year_months": pa.schema(
+        [
+            ("year_month", STRING),
+            ("sum(paid_amount)", DOUBLE),
+        ]
+    ),
+    "summary_stats": pa.schema(
+        [
+            ("display", STRING),
+            ("year", STRING),
+            ("quarter", STRING),
+            ("prior_quarter", STRING),
+            ("current_period_medical_paid", DOUBLE),
+            ("prior_period_medical_paid", DOUBLE),
+            ("pct_change_medical_paid", DOUBLE),
+            ("current_period_member_months", INT),
+            # Null in the first quarter, where there is no prior period
+            ("prior_period_member_months", DOUBLE),
+            ("pct_change_member_months", DOUBLE),
+        ]
+    ),
+    "pmpm_by_claim_type": pa.schema(
+        [
+            ("year_month", STRING),
+            ("claim_type", STRING),
+            ("paid_amount_sum", DOUBLE),
+            ("member_month_count", INT),
+            ("year", STRING),
+            ("paid_amount_pmpm", DOUBLE),
+        ]
+    ),
+    "pmpm_by_service_category_1": pa.schema(
+        [
+            ("year_month", STRING),
+            ("service_category_1", STRING),
+            ("paid_amount_sum", DOUBLE),
+            ("row_count", INT),
+            ("member_month_count", INT),
+            ("paid_amount_pmpm", DOUBLE),
+        ]
+    ),
+    **{
+        name: pa.schema(
+            [
+                ("year_month", STRING),
+                ("service_category_1", STRING),
+                (dimension, STRING),
+                ("paid_amount_sum", DOUBLE),
+                ("row_count", INT),
+                ("member_month_count", INT),
+                ("paid_amount_pmpm", DOUBLE),
+            ]
+        )
+        for name, dimension in [
+            ("pmpm_by_service_category_1_2", "service_category_2"),
+            ("pmpm_by_service_category_1_provider", "provider_name"),
+            ("pmpm_by_service_category_1_condition", "condition_family"),
+            ("pmpm_by_service_category_1_claim_type", "claim_type"),
+        ]
+    },
+    "pmpm_data": pa.schema(
+        [
+            ("year_month", STRING),
+            ("total_pmpm", DOUBLE),
+            ("medical_pmpm", DOUBLE),
+            ("pharmacy_pmpm", DOUBLE),
+            ("inpatient_pmpm", DOUBLE),
+            ("outpatient_pmpm", DOUBLE),
+            ("office_visit_pmpm", DOUBLE),
+            ("ancillary_pmpm", DOUBLE),
+            ("other_pmpm", DOUBLE),
+            ("member_count", INT),
+            ("pharmacy_spend", DOUBLE),
+        ]
+    ),
+    "gender_data": pa.schema([("gender", STRING), ("count", INT)]),
+    "race_data": pa.schema([("race", STRING), ("count", INT)]),
+    "age_data": pa.schema([("age_group", STRING), ("count", INT)]),
+    "pmpm_by_chronic_condition": pa.schema(
+        [
+            ("year_month", STRING),
+            ("condition_family", STRING),
+            ("medical_paid_amount_sum", DOUBLE),
+            ("member_month_count", INT),
+        ]
+    ),
+    "condition_data": pa.schema(
+        [
+            ("diagnosis_year_month", STRING),
+            ("condition", STRING),
+            ("condition_cases", INT),
+            ("diagnosis_duration", DOUBLE),
+        ]
+    ),
+}
+
+
+class SchemaMismatch(ValueError):
+    """An extract's columns or values do not match its declared schema."""
+
+
+def check(name, names):
+    """Raises SchemaMismatch unless `names`, the columns of a file of extract
+    `name`, are exactly the declared ones (in any order)."""
+    declared = SCHEMAS[name].names
+    missing = [c for c in declared if c not in names]
+    extra = [c for c in names if c not in declared]
+    if missing or extra:
+        raise SchemaMismatch(f"{name}: missing columns {missing}, unexpected {extra}")
+
+
+def dtypes(name, columns=None):
+    """The pandas dtypes of an extract's columns, for readers that take them
+    rather than an Arrow schema (dask)."""
+    schema = SCHEMAS[name]
+    return {
+        column: schema.field(column).type.to_pandas_dtype()
+        for column in columns or schema.names
+    }
@@ -1,26 +1,159 @@
-import snowflake.connector as sn
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache, reduce
+
+import numpy as np
 import pandas as pd
-import tomli
+import pyarrow as pa
+import pyarrow.compute as pc
+
 
-with open(".streamlit/secrets.toml", mode="rb") as fp:
-    config = tomli.load(fp)
+@lru_cache(maxsize=None)
+def config():
+    import tomli
+
+    with open(".streamlit/secrets.toml", mode="rb") as fp:
+        return tomli.load(fp)
 
 
 def connection(database=None):
+    # The connector takes about half a second to import, only live loads on
+    # Snowflake need it
+    import snowflake.connector as sn
+
+    config_ = config()
     return sn.connect(
-        user=config["SNOWFLAKE_USER"],
-        password=config["SNOWFLAKE_PASSWORD"],
-        account=config["SNOWFLAKE_ACCOUNT"],
-        warehouse=config["SNOWFLAKE_WH"],
-        role=config["SNOWFLAKE_ROLE"],
+        user=config_["SNOWFLAKE_USER"],
+        password=config_["SNOWFLAKE_PASSWORD"],
+        account=config_["SNOWFLAKE_ACCOUNT"],
+        warehouse=config_["SNOWFLAKE_WH"],
+        role=config_["SNOWFLAKE_ROLE"],
         database=database or "tuva_project_demo",
     )
 
 
+class ConnectionPool:
+    """Thread-safe pool of DB-API connections.
+
+    Connections are opened by `connect()` on first use, never at construction,
+    and at most `max_size` are open at once; callers block until one is
+    returned. Idle connections older than `idle_timeout` seconds are closed and
+    every connection is checked with `health_check` before it is handed out.
+    """
+
+    def __init__(self, connect, max_size=4, idle_timeout=600, health_check="select 1"):
+        self.connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check = health_check
+        self.size = 0
+        self._idle = []
+        self._cond = threading.Condition()
+
+    def _healthy(self, conn):
+        try:
+            cur = conn.cursor()
+            try:
+                cur.execute(self.health_check)
+            finally:
+                cur.close()
+            return True
+        except Exception:
+            return False
+
+    def _expired(self):
+        # Caller holds self._cond
+        cutoff = time.monotonic() - self.idle_timeout
+        expired = [conn for conn, last_used in self._idle if last_used < cutoff]
+        self._idle = [(c, t) for c, t in self._idle if t >= cutoff]
+        self.size -= len(expired)
+        return expired
+
+    def acquire(self, timeout=None):
+        conn = None
+        with self._cond:
+            expired = self._expired()
+            while not self._idle and self.size >= self.max_size:
+                if not self._cond.wait(timeout):
+                    raise TimeoutError("no connection available")
+            if self._idle:
+                conn, _ = self._idle.pop()
+            else:
+                self.size += 1
+        for stale in expired:
+            _close(stale)
+
+        if conn is not None:
+            if self._healthy(conn):
+                return conn
+            _close(conn)
+        try:
+            return self.connect()
+        except Exception:
+            with self._cond:
+                self.size -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn):
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self.size -= len(idle)
+        for conn, _ in idle:
+            _close(conn)
+
+
+def _close(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool(database=None):
+    """Returns the process-wide Snowflake pool for `database`. Nothing connects
+    until the first query runs through it."""
+    with _pools_lock:
+        if database not in _pools:
+            _pools[database] = ConnectionPool(lambda: connection(database))
+        return _pools[database]
+
+
 def safe_to_pandas(conn, query):
+    """Runs `query` on a connection or a ConnectionPool and returns the result
+    with lowercase column names and numeric amount columns."""
+    if isinstance(conn, ConnectionPool):
+        with conn.connection() as pooled:
+            return safe_to_pandas(pooled, query)
     cur = conn.cursor()
-    data = cur.execute(query).fetch_pandas_all()
-    cur.close()
+    try:
+        cur.execute(query)
+        if hasattr(cur, "fetch_pandas_all"):
+            data = cur.fetch_pandas_all()
+        else:
+            # Plain DB-API cursor
+            columns = [d[0] for d in cur.description]
+            data = pd.DataFrame.from_records(cur.fetchall(), columns=columns)
+    finally:
+        cur.close()
     lowercase = lambda x: str(x).lower()
     rename_dict = {k: lowercase(k) for k in data}
     data = data.rename(columns=rename_dict)
@@ -29,6 +162,70 @@ def safe_to_pandas(conn, query):
     return data
 
 
+def _numeric_column(name):
+    return ("amount" in name) or (name == "member_month_count")
+
+
+def normalize_arrow(table):
+    """Arrow counterpart of the clean-up in safe_to_pandas: lowercases column
+    names and casts amount columns held as decimals or strings to float64. The
+    untouched columns keep their buffers, nothing is copied for them."""
+    if isinstance(table, pa.RecordBatch):
+        table = pa.Table.from_batches([table])
+    table = table.rename_columns([str(name).lower() for name in table.column_names])
+    for i, field in enumerate(table.schema):
+        if _numeric_column(field.name) and not (
+            pa.types.is_integer(field.type) or pa.types.is_floating(field.type)
+        ):
+            table = table.set_column(
+                i, field.name, pc.cast(table.column(i), pa.float64())
+            )
+    return table
+
+
+def _dbapi_batches(cur, size):
+    names = [d[0] for d in cur.description]
+    while True:
+        rows = cur.fetchmany(size)
+        if not rows:
+            return
+        yield pa.table([list(column) for column in zip(*rows)], names=names)
+
+
+def iter_arrow(conn, query, batch_size=100_000):
+    """Yields the result of `query` as normalized Arrow tables, one per batch
+    the driver streams back, so the full result is never fetched at once."""
+    if isinstance(conn, ConnectionPool):
+        with conn.connection() as pooled:
+            yield from iter_arrow(pooled, query, batch_size)
+        return
+    cur = conn.cursor()
+    try:
+        cur.execute(query)
+        if hasattr(cur, "fetch_arrow_batches"):
+            batches = cur.fetch_arrow_batches()
+        else:
+            batches = _dbapi_batches(cur, batch_size)
+        for batch in batches:
+            yield normalize_arrow(batch)
+    finally:
+        cur.close()
+
+
+def safe_to_arrow(conn, query, reducer=None, initial=None):
+    """Streaming variant of safe_to_pandas. With a `reducer`, every batch is
+    folded in as `reducer(accumulated, batch)` starting from `initial` and the
+    result is returned, so callers that aggregate never hold the raw rows.
+    Without one, the batches are assembled into a single table once."""
+    batches = iter_arrow(conn, query)
+    if reducer is not None:
+        return reduce(reducer, batches, initial)
+    tables = list(batches)
+    if not tables:
+        return pa.table({})
+    return pa.concat_tables(tables, promote_options="default")
+
+
 def human_format(num):
     num = float("{:.3g}".format(num))
     magnitude = 0
@@ -40,22 +237,100 @@ def human_format(num):
     )
 
 
+def _near_half(scaled):
+    # Binary rounding of the scaled values can land either side of a decimal
+    # .5, where Python's correctly rounded formatting decides by the exact value
+    return np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+
+
+def _with_fallback(text, values, mask, format_one):
+    # The cells in `mask` formatted one at a time by the scalar formatter, on
+    # Python floats: round() of a numpy float rounds like numpy
+    if not mask.any():
+        return text
+    return pc.replace_with_mask(
+        text, pa.array(mask), pa.array([format_one(x) for x in values[mask].tolist()])
+    )
+
+
+def human_format_array(values):
+    """Vectorized `human_format`: 3 significant digits with a K/M/B/T suffix,
+    as a pyarrow string array. Zero formats as "0", NaN as null."""
+    values = np.asarray(values, dtype="float64")
+    valid = np.isfinite(values) & (values != 0)
+    size = np.where(valid, np.abs(values), 1.0)
+    # size ~= mantissa * 10**(exp - 2) with a 3 digit integer mantissa, rounded
+    # like "{:.3g}"
+    exp = np.floor(np.log10(size)).astype("int64")
+    exp -= size < 10.0**exp
+    scaled = np.where(exp >= 2, size / 10.0 ** (exp - 2), size * 10.0 ** (2 - exp))
+    mantissa = scaled.round()
+    carry = mantissa >= 1000
+    mantissa[carry] = 100
+    exp[carry] += 1
+    magnitude = np.clip(exp // 3, 0, 4)
+    # The shown number in millionths, "{:f}" keeps 6 decimals
+    shift = exp - 2 - 3 * magnitude + 6
+    micros = (mantissa * 10.0 ** np.maximum(shift, 0)).astype("int64")
+    whole = pc.cast(pa.array(micros // 10**6), pa.string())
+    # 1000000 + 230000 -> "1230000" -> ".230000" -> ".23", and "." when whole
+    fraction = pc.cast(pa.array(micros % 10**6 + 10**6), pa.string())
+    fraction = pc.ascii_rtrim(pc.utf8_replace_slice(fraction, 0, 1, "."), "0")
+    fraction = pc.ascii_rtrim(fraction, ".")
+    text = pc.binary_join_element_wise(
+        pc.if_else(pa.array(values < 0), "-", ""),
+        whole,
+        fraction,
+        pa.array(["", "K", "M", "B", "T"]).take(magnitude),
+        "",
+    )
+    text = pc.if_else(pa.array(values == 0), "0", text)
+    # Under 1e-4 "{:f}" rounds the 3 digits again, from their binary value
+    text = _with_fallback(
+        text, values, valid & (_near_half(scaled) | (shift < 0)), human_format
+    )
+    return pc.if_else(pa.array(np.isfinite(values)), text, pa.nulls(len(values)))
+
+
+def _percent(x):
+    return f"{round(x, 4) * 100}"
+
+
+def percent_format_array(values):
+    """Vectorized `f"{round(x, 4) * 100}%"`, as a pyarrow string array."""
+    values = np.asarray(values, dtype="float64")
+    shown = values.round(4) * 100
+    # Arrow writes the same shortest round-trip digits as repr(), less the
+    # ".0" on whole numbers. It switches to exponents from 1e10 and under 1e-4
+    # where repr() does not, those go through repr() itself.
+    text = pc.cast(pa.array(shown), pa.string())
+    whole = pa.array(shown == np.floor(shown))
+    text = pc.if_else(whole, pc.binary_join_element_wise(text, ".0", ""), text)
+    size = np.abs(shown)
+    exponent = (size >= 1e9) | ((size < 1e-3) & (size != 0))
+    odd = (exponent | _near_half(np.abs(values) * 1e4)) & np.isfinite(values)
+    text = _with_fallback(text, values, odd, _percent)
+    return pc.binary_join_element_wise(text, "%", "")
+
+
+def _format_column(values, format_array, prefix=""):
+    # Zero and missing values are shown blank
+    values = values.to_numpy(dtype="float64", na_value=np.nan)
+    text = pc.binary_join_element_wise(prefix, format_array(values), "")
+    blank = pa.array((values == 0) | np.isnan(values))
+    return pd.arrays.ArrowStringArray(pc.if_else(blank, "", text))
+
+
 def format_df(df):
-    df = df.copy(deep=True)
+    # Shallow copy, the formatted columns are new arrays so the caller's frame
+    # is left as it was
+    df = df.copy(deep=False)
     # format column values
     for c in df:
         if "pct" in c:
-            df[c] = (
-                df[c]
-                .apply(lambda x: f"{round(x, 4) * 100}%" if x else "")
-                .replace("nan%", "")
-            )
+            df[c] = _format_column(df[c], percent_format_array)
         elif "pmpm" in c:
-            df[c] = (
-                df[c]
-                .apply(lambda x: f"${human_format(x)}" if x else "")
-                .replace("$nan", "")
-            )
+            df[c] = _format_column(df[c], human_format_array, prefix="$")
 
     # format column headers
     df.columns = [
@@ -65,9 +340,9 @@ def format_df(df):
     return df
 
 
-def group_for_pmpm(df, grouping_column):
+def group_for_pmpm(df, grouping_column, top_n=None):
     grouped_df = (
-        df.groupby(grouping_column)[
+        df.groupby(grouping_column, observed=True)[
             ["paid_amount_sum", "member_month_count", "row_count"]
         ]
         .sum()
@@ -75,6 +350,8 @@ def group_for_pmpm(df, grouping_column):
         .assign(
             paid_amount_pmpm=lambda x: x["paid_amount_sum"] / x["member_month_count"]
         )
-        .reset_index()
     )
-    return grouped_df
+    if top_n:
+        # Partial selection, only the top rows are ever sorted
+        grouped_df = grouped_df.nlargest(top_n, "paid_amount_pmpm")
+    return grouped_df.reset_index()
@@ -0,0 +1,76 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import data
+import drilldown
+import refresh
+
+log = logging.getLogger(__name__)
+
+# Seconds each loader took during the last warm-up, by loader name
+timings = {}
+
+_thread = None
+_lock = threading.Lock()
+
+
+def _timed(loader):
+    start = time.perf_counter()
+    loader()
+    return time.perf_counter() - start
+
+
+def warm(loaders=None, max_workers=8):
+    """Runs the loaders concurrently on a bounded pool so their results land in
+    the shared cache, and returns the seconds each one took."""
+    # The drilldown cube waits on the extracts it is built from
+    loaders = data.warm_loaders + [drilldown.cube] if loaders is None else loaders
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers, thread_name_prefix="warmup") as pool:
+        futures = {loader.__name__: pool.submit(_timed, loader) for loader in loaders}
+    for name, future in futures.items():
+        try:
+            timings[name] = future.result()
+            log.info("warmed %s in %.2fs", name, timings[name])
+        except Exception:
+            log.exception("warm-up of %s failed", name)
+    log.info(
+        "warm-up finished in %.2fs (%.2fs of loader time)",
+        time.perf_counter() - start,
+        sum(timings[name] for name in futures if name in timings),
+    )
+    return timings
+
+
+def start(max_workers=8):
+    """Starts the warm-up in a background thread, once per server process.
+    Pages call this first thing; a page that asks for an extract still being
+    loaded waits for that load instead of fetching it again."""
+    global _thread
+    with _lock:
+        if _thread is None:
+            # Record the published manifest before anything is cached, so
+            # months landing during the warm-up are picked up by the next poll
+            interval = os.environ.get("DATA_STORIES_REFRESH_SECONDS")
+            if interval:
+                refresh.start(float(interval))
+            _thread = threading.Thread(
+                target=warm,
+                kwargs={"max_workers": max_workers},
+                name="warmup",
+                daemon=True,
+            )
+            _thread.start()
+    return _thread
+
+
+if __name__ == "__main__":
+    start_time = time.perf_counter()
+    result = warm()
+    for name, seconds in sorted(result.items(), key=lambda x: -x[1]):
+        print(f"{name:45} {seconds:6.2f}s")
+    print(f"{'total (wall)':45} {time.perf_counter() - start_time:6.2f}s")
+    print(f"{'total (sum of loaders)':45} {sum(result.values()):6.2f}s")